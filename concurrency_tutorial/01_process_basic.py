@@ -6,6 +6,16 @@
 import multiprocessing as mp
 import time
 import os
+import pickle
+import queue
+import struct
+import tracemalloc
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，只有共享内存数组示例需要
+    np = None
 
 
 # ===== 示例1: 基本的进程创建 =====
@@ -44,6 +54,48 @@ def example_basic_process():
 
 
 # ===== 示例2: 进程间通信 - Queue =====
+class BatchProcessQueue:
+    """支持批量存取和关闭的进程队列
+
+    底层仍是 mp.Queue，但每个元素是一批数据（list），pickle 和管道读写按批进行。
+    get_many 从本进程缓存的当前批中取出最多 max_items 个；
+    close() 放入一个关闭标记，每个读到它的消费者立即把它放回去再返回 []，
+    所以所有消费者都会在毫秒级内结束，不需要为每个消费者放一个 None。
+    """
+    def __init__(self, maxsize=0, batch_size=256):
+        self.batch_size = batch_size
+        self._queue = mp.Queue(maxsize)
+        self._buffer = []     # 本进程取到但还没返回的元素
+        self._eof = False
+
+    def put(self, item):
+        self._queue.put([item])
+
+    def put_many(self, items):
+        """按 batch_size 分批放入"""
+        items = list(items)
+        for start in range(0, len(items), self.batch_size):
+            self._queue.put(items[start:start + self.batch_size])
+
+    def get_many(self, max_items=256, timeout=None):
+        """取出 1~max_items 个元素；关闭且排空后返回 []，超时抛出 queue.Empty"""
+        if not self._buffer:
+            if self._eof:
+                return []
+            batch = self._queue.get(timeout=timeout)
+            if batch is None:
+                self._queue.put(None)  # 关闭标记留给其他消费者
+                self._eof = True
+                return []
+            self._buffer = batch
+        items, self._buffer = self._buffer[:max_items], self._buffer[max_items:]
+        return items
+
+    def close(self):
+        """生产者全部完成后调用一次"""
+        self._queue.put(None)
+
+
 def producer(queue, items):
     """生产者：向队列中放入数据"""
     print(f"[生产者 PID: {os.getpid()}] 开始生产")
@@ -51,7 +103,7 @@ def producer(queue, items):
         print(f"  生产: {item}")
         queue.put(item)
         time.sleep(0.5)
-    queue.put(None)  # 发送结束信号
+    queue.close()  # 发送结束信号，所有消费者都会收到
     print("[生产者] 完成")
 
 
@@ -59,12 +111,12 @@ def consumer(queue, name):
     """消费者：从队列中取出数据"""
     print(f"[消费者-{name} PID: {os.getpid()}] 开始消费")
     while True:
-        item = queue.get()
-        if item is None:
-            queue.put(None)  # 传递结束信号给其他消费者
+        items = queue.get_many(max_items=2)
+        if not items:  # 队列已关闭且取完
             break
-        print(f"  消费者-{name} 消费: {item}")
-        time.sleep(0.8)
+        for item in items:
+            print(f"  消费者-{name} 消费: {item}")
+            time.sleep(0.8)
     print(f"[消费者-{name}] 完成")
 
 
@@ -74,8 +126,8 @@ def example_queue_communication():
     print("示例2: 进程间通信 - Queue")
     print("="*60)
     
-    # 创建一个队列
-    queue = mp.Queue()
+    # 创建一个队列（基于 mp.Queue，支持批量取出和关闭，见下方 BatchProcessQueue）
+    queue = BatchProcessQueue()
     
     # 生产数据
     items = ['苹果', '香蕉', '橙子', '葡萄', '西瓜']
@@ -100,6 +152,70 @@ def example_queue_communication():
     print("生产者-消费者模式完成")
 
 
+# ===== 示例2补充: 批量队列的性能 =====
+def batch_consumer(queue, name, results):
+    """批量消费者：一次取一批，队列关闭后立即退出"""
+    count = 0
+    while True:
+        items = queue.get_many()
+        if not items:
+            break
+        count += len(items)
+    results.put((name, count))
+
+
+def sentinel_consumer(queue, name, results):
+    """逐条消费者：直接用 mp.Queue，收到 None 后放回去传给其他消费者再退出"""
+    count = 0
+    while True:
+        item = queue.get()
+        if item is None:
+            queue.put(None)
+            break
+        count += 1
+    results.put((name, count))
+
+
+def example_batch_queue(num_items=50000, num_consumers=2):
+    """示例2补充: 批量队列 vs 逐条 mp.Queue"""
+    print("\n" + "="*60)
+    print(f"示例2补充: 批量队列 ({num_items} 个元素, {num_consumers} 个消费者进程)")
+    print("="*60)
+
+    timings = {}
+    for label, queue, consumer_func in [
+            ("逐条 mp.Queue", mp.Queue(), sentinel_consumer),
+            ("批量 BatchProcessQueue", BatchProcessQueue(batch_size=256), batch_consumer)]:
+        results = mp.Queue()
+        consumers = [mp.Process(target=consumer_func, args=(queue, i, results))
+                     for i in range(num_consumers)]
+        for p in consumers:
+            p.start()
+        start = time.perf_counter()
+        if isinstance(queue, BatchProcessQueue):
+            queue.put_many(range(num_items))
+            queue.close()
+        else:
+            for i in range(num_items):
+                queue.put(i)
+            queue.put(None)
+        counts = dict(results.get() for _ in consumers)
+        duration = time.perf_counter() - start
+        for p in consumers:
+            p.join()
+        assert sum(counts.values()) == num_items
+        timings[label] = duration
+        print(f"\n[{label}] {duration:.2f} 秒, {num_items/duration:>8.0f} 个/秒, "
+              f"各消费者: {[counts[i] for i in range(num_consumers)]}")
+
+    single, batch = timings.values()
+    print(f"\n批量加速: {single/batch:.1f}x")
+    print("\n要点:")
+    print("- mp.Queue 每个元素都要单独 pickle、写管道、唤醒消费者")
+    print("- 按批传输后，这些开销按批大小分摊")
+    print("- close() 封装了结束信号，消费者只需要判断 get_many 是否返回空列表")
+
+
 # ===== 示例3: 进程间通信 - Pipe =====
 def sender(conn, messages):
     """发送者：通过管道发送消息"""
@@ -148,6 +264,145 @@ def example_pipe_communication():
     print("管道通信完成")
 
 
+# ===== 示例3补充: 零拷贝分帧传输 =====
+class FramedConnection:
+    """在 Pipe 的 Connection 上收发分帧的 bytes 消息，尽量避免多余的拷贝和分配
+
+    - send_bytes 直接接受 bytes / bytearray / memoryview，不经过 pickle
+    - recv_into 把消息读进预先分配、反复使用的缓冲区，返回指向它的 memoryview
+      （下一次接收会覆盖这块内存，需要保留的数据请自行拷贝）
+    - send_obj / recv_obj 用 pickle 协议5：对象里的大块缓冲区（bytearray、NumPy 数组等）
+      作为带外数据单独成帧发送，接收端直接读进最终的 bytearray，不再经过一次 pickle 拷贝
+    """
+    _COUNT = struct.Struct('I')
+    _LENGTH = struct.Struct('Q')
+
+    def __init__(self, conn, buffer_size=1024 * 1024):
+        self.conn = conn
+        self._buffer = bytearray(buffer_size)
+
+    def send_bytes(self, data):
+        self.conn.send_bytes(data)
+
+    def recv_into(self):
+        """接收一帧，返回缓冲区上的 memoryview；消息比缓冲区大时自动扩容"""
+        try:
+            size = self.conn.recv_bytes_into(self._buffer)
+        except mp.BufferTooShort as e:
+            self._buffer = bytearray(e.args[0])
+            size = len(self._buffer)
+        return memoryview(self._buffer)[:size]
+
+    def send_obj(self, obj):
+        buffers = []
+        data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        raws = [b.raw() for b in buffers]
+        header = self._COUNT.pack(len(raws)) + b''.join(self._LENGTH.pack(r.nbytes) for r in raws)
+        self.conn.send_bytes(header + data)
+        for raw in raws:
+            self.conn.send_bytes(raw)
+
+    def recv_obj(self):
+        frame = self.recv_into()
+        count = self._COUNT.unpack_from(frame)[0]
+        offset = self._COUNT.size
+        buffers = []
+        for _ in range(count):
+            length = self._LENGTH.unpack_from(frame, offset)[0]
+            offset += self._LENGTH.size
+            buffers.append(bytearray(length))
+        data = bytes(frame[offset:])  # 先拷出 pickle 数据，下面接收带外数据不能覆盖它
+        for buf in buffers:
+            self.conn.recv_bytes_into(buf)
+        return pickle.loads(data, buffers=buffers)
+
+    def close(self):
+        self.conn.close()
+
+
+def plain_sender(conn, payload, count):
+    """对照组：send() 每条消息都 pickle"""
+    for _ in range(count):
+        conn.send(payload)
+    conn.send(None)
+    conn.close()
+
+
+def framed_sender(conn, payload, count):
+    framed = FramedConnection(conn)
+    view = memoryview(payload)
+    for _ in range(count):
+        framed.send_bytes(view)
+    framed.send_bytes(b'')  # 空帧表示结束
+    framed.close()
+
+
+def object_sender(conn, obj, count, framed):
+    if framed:
+        conn = FramedConnection(conn)
+        for _ in range(count):
+            conn.send_obj(obj)
+    else:
+        for _ in range(count):
+            conn.send(obj)
+    conn.close()
+
+
+def example_framed_pipe(count=20000, sizes=(64, 65536), obj_size=8 * 1024 * 1024, obj_count=20):
+    """示例3补充: send/recv vs 分帧 send_bytes/recv_bytes_into"""
+    print("\n" + "="*60)
+    print("示例3补充: 零拷贝分帧传输")
+    print("="*60)
+
+    for size in sizes:
+        payload = b'x' * size
+        n = count if size <= 4096 else count // 10
+        print(f"\n[bytes 消息] {n} 条 × {size} 字节")
+        for label, target in [("send/recv", plain_sender),
+                              ("send_bytes/recv_bytes_into", framed_sender)]:
+            reader, writer = mp.Pipe(duplex=False)
+            p = mp.Process(target=target, args=(writer, payload, n))
+            start = time.perf_counter()
+            p.start()
+            writer.close()
+            received = 0
+            if target is plain_sender:
+                while reader.recv() is not None:
+                    received += 1
+            else:
+                framed = FramedConnection(reader)
+                while len(framed.recv_into()):
+                    received += 1
+            duration = time.perf_counter() - start
+            p.join()
+            assert received == n
+            print(f"  {label:<28} {n/duration:>9.0f} 条/秒  "
+                  f"{n*size/duration/(1024*1024):>8.1f} MB/s")
+
+    # 大对象：pickle 协议5的带外缓冲区
+    obj = {'name': 'frame', 'pixels': bytearray(obj_size)}
+    print(f"\n[大对象] {obj_count} 个 × {obj_size // (1024*1024)} MB（字典里包含 bytearray）")
+    for label, framed in [("send/recv", False), ("send_obj/recv_obj (协议5)", True)]:
+        reader, writer = mp.Pipe(duplex=False)
+        p = mp.Process(target=object_sender, args=(writer, obj, obj_count, framed))
+        start = time.perf_counter()
+        p.start()
+        writer.close()
+        conn = FramedConnection(reader) if framed else reader
+        for _ in range(obj_count):
+            received = conn.recv_obj() if framed else conn.recv()
+            assert len(received['pixels']) == obj_size
+        duration = time.perf_counter() - start
+        p.join()
+        print(f"  {label:<28} {obj_count/duration:>9.1f} 个/秒  "
+              f"{obj_count*obj_size/duration/(1024*1024):>8.1f} MB/s")
+
+    print("\n要点:")
+    print("- send/recv 每条消息都 pickle，并为每次接收分配新对象")
+    print("- send_bytes 直接发送缓冲区，recv_bytes_into 读进复用的缓冲区")
+    print("- pickle 协议5把大缓冲区作为带外数据单独传输，省掉序列化时的整块拷贝")
+
+
 # ===== 示例4: 进程池 =====
 def compute_square(n):
     """计算平方（模拟CPU密集型任务）"""
@@ -181,6 +436,116 @@ def example_process_pool():
     print(f"耗时: {end_time - start_time:.2f} 秒")
 
 
+# ===== 示例4补充: 流式进程池 =====
+def stream_map(func, iterable, processes=None, window=None, ordered=False,
+               maxtasksperchild=None):
+    """在进程池上流式执行 func，边提交边产出结果
+
+    - 最多只有 window 个任务已提交但结果还没被取走，输入按需从 iterable 里读取
+    - ordered=False 时按完成顺序产出；ordered=True 时按输入顺序产出，
+      先完成的结果在重排缓冲区里等待，缓冲区同样受 window 限制
+    - maxtasksperchild 让工作进程处理一定数量的任务后重建，防止内存泄漏累积
+    首个结果的等待时间和内存占用都与输入长度无关。
+    """
+    processes = processes or mp.cpu_count()
+    window = window or 2 * processes
+    done = queue.Queue()
+    items = iter(enumerate(iterable))
+
+    with mp.Pool(processes, maxtasksperchild=maxtasksperchild) as pool:
+        def submit():
+            for index, item in items:
+                pool.apply_async(func, (item,),
+                                 callback=lambda result, i=index: done.put((i, True, result)),
+                                 error_callback=lambda exc, i=index: done.put((i, False, exc)))
+                return True
+            return False
+
+        in_flight = 0  # 已提交但还没产出的任务数（包括重排缓冲区里的）
+        while in_flight < window and submit():
+            in_flight += 1
+
+        pending = {}
+        next_index = 0
+        while in_flight:
+            index, ok, value = done.get()
+            if not ok:
+                raise value
+            if not ordered:
+                in_flight -= 1
+                if submit():
+                    in_flight += 1
+                yield value
+                continue
+            pending[index] = value
+            while next_index in pending:
+                result = pending.pop(next_index)
+                next_index += 1
+                in_flight -= 1
+                if submit():
+                    in_flight += 1
+                yield result
+
+
+def slow_square(n):
+    """不打印的平方计算，模拟每个任务 2ms"""
+    time.sleep(0.002)
+    return n * n
+
+
+def worker_pid(_):
+    time.sleep(0.001)
+    return os.getpid()
+
+
+def example_streaming_pool(sizes=(1000, 4000), processes=4):
+    """示例4补充: pool.map vs 流式 stream_map"""
+    print("\n" + "="*60)
+    print("示例4补充: 流式进程池")
+    print("="*60)
+
+    with mp.Pool(processes) as pool:
+        pool.map(slow_square, range(processes))  # 预热，避免首次导入的内存分配计入统计
+
+    print(f"\n{'输入规模':<8}{'方式':<18}{'首个结果':>10}{'总耗时':>10}{'内存峰值':>12}")
+    for size in sizes:
+        for label in ("pool.map", "stream_map 无序", "stream_map 有序"):
+            tracemalloc.start()
+            start = time.perf_counter()
+            first = None
+            total = 0
+            if label == "pool.map":
+                with mp.Pool(processes) as pool:
+                    results = pool.map(slow_square, (n for n in range(size)))
+                first = time.perf_counter() - start
+                total = sum(results)
+            else:
+                ordered = label.endswith("有序")
+                expected = 0
+                for result in stream_map(slow_square, (n for n in range(size)),
+                                         processes=processes, window=32, ordered=ordered):
+                    if first is None:
+                        first = time.perf_counter() - start
+                    if ordered:
+                        assert result == expected * expected
+                        expected += 1
+                    total += result
+            duration = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert total == sum(n * n for n in range(size))
+            print(f"{size:<12}{label:<18}{first:>9.3f}s{duration:>9.2f}s{peak/1024:>10.0f} KB")
+
+    pids = set(stream_map(worker_pid, range(200), processes=2, maxtasksperchild=20))
+    print(f"\n[maxtasksperchild=20] 2 个进程处理 200 个任务，共用到 {len(pids)} 个不同的工作进程")
+
+    print("\n要点:")
+    print("- pool.map 先把输入整个变成列表，所有任务完成后才一次性返回")
+    print("- stream_map 只保持 window 个任务在途，首个结果几毫秒就到，内存不随输入增长")
+    print("- 有序模式用重排缓冲区按输入顺序产出，缓冲区大小同样受 window 限制")
+    print("- 代价是每个任务单独提交，任务很短时总耗时略高于按块提交的 pool.map")
+
+
 # ===== 示例5: 共享内存 =====
 def increment_shared_value(shared_val, lock, name):
     """增加共享变量的值"""
@@ -217,6 +582,190 @@ def example_shared_memory():
     print("（如果没有锁，最终值可能小于10，因为会有竞态条件）")
 
 
+# ===== 示例5补充: 分片计数器 =====
+class ShardedCounter:
+    """多进程分片计数器：每个工作进程写自己的槽位，读取时求和
+
+    槽位放在一个不带锁的共享数组里，每个槽位占一个缓存行（64字节），
+    不同进程写各自的缓存行，既不需要锁，也不会互相使缓存失效（伪共享）。
+    每个槽位只能由一个进程写；value() 读到的是近似实时的总数，所有进程结束后是精确值。
+    """
+    SLOT_STRIDE = 8  # 8 个 int64 = 64 字节
+
+    def __init__(self, num_slots):
+        self.num_slots = num_slots
+        self._slots = mp.RawArray('q', num_slots * self.SLOT_STRIDE)
+
+    def add(self, slot, amount=1):
+        self._slots[slot * self.SLOT_STRIDE] += amount
+
+    def value(self):
+        return sum(self._slots[i * self.SLOT_STRIDE] for i in range(self.num_slots))
+
+
+def increment_locked(shared_val, count):
+    """对照组：每次加一都获取跨进程锁"""
+    for _ in range(count):
+        with shared_val.get_lock():
+            shared_val.value += 1
+
+
+def increment_sharded(counter, slot, count):
+    for _ in range(count):
+        counter.add(slot)
+
+
+def example_sharded_counter(num_workers=4, count=50000):
+    """示例5补充: 加锁的 mp.Value vs 分片计数器"""
+    print("\n" + "="*60)
+    print(f"示例5补充: 分片计数器 ({num_workers} 个进程 × {count} 次加一)")
+    print("="*60)
+
+    shared_value = mp.Value('q', 0)
+    workers = [mp.Process(target=increment_locked, args=(shared_value, count))
+               for _ in range(num_workers)]
+    start = time.perf_counter()
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    locked_time = time.perf_counter() - start
+    print(f"\n[加锁 mp.Value]  {locked_time:.2f} 秒, 结果 {shared_value.value}")
+
+    counter = ShardedCounter(num_workers)
+    workers = [mp.Process(target=increment_sharded, args=(counter, slot, count))
+               for slot in range(num_workers)]
+    start = time.perf_counter()
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    sharded_time = time.perf_counter() - start
+    print(f"[分片计数器]     {sharded_time:.2f} 秒, 结果 {counter.value()} "
+          f"(加速 {locked_time/sharded_time:.1f}x)")
+    assert counter.value() == shared_value.value == num_workers * count
+
+    print("\n要点:")
+    print("- 加锁版本每次加一都是一次跨进程的锁获取和释放，进程越多竞争越严重")
+    print("- 分片版本每个进程只写自己的槽位，热路径上没有锁")
+    print("- 槽位按缓存行对齐，避免不同CPU核心反复争抢同一个缓存行")
+
+
+# ===== 示例5补充: 共享内存 NumPy 数组 =====
+class SharedArray:
+    """放在 multiprocessing.shared_memory 里的 NumPy 数组
+
+    主进程创建后把它作为参数传给子进程或进程池任务：pickle 时只传共享内存块的名字、
+    形状和类型，子进程按名字重新挂载，看到的是同一块内存，不拷贝数据。
+    创建者负责删除（unlink）共享内存块，其他进程只关闭自己的映射。
+    先创建 SharedArray 再创建进程池：这样工作进程和创建者共用同一个 resource_tracker，
+    共享内存块只由创建者 unlink，父进程崩溃时 tracker 也会负责清理。
+
+        with SharedArray((1000, 1000), 'float64') as shared:
+            shared.array[:] = 1.0
+            with mp.Pool(4) as pool:
+                pool.map(work, [(shared, start, stop) for start, stop in chunks])
+    """
+    def __init__(self, shape, dtype='float64'):
+        self.shape = tuple(np.atleast_1d(shape))
+        self.dtype = np.dtype(dtype)
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        self._owner = True
+
+    def __getstate__(self):
+        return {'name': self.shm.name, 'shape': self.shape, 'dtype': self.dtype.str}
+
+    def __setstate__(self, state):
+        self.shape = state['shape']
+        self.dtype = np.dtype(state['dtype'])
+        self.shm = self._attach(state['name'])
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        self._owner = False
+
+    @staticmethod
+    def _attach(name):
+        """按名字挂载；Python 3.13+ 不再登记到 resource_tracker
+
+        3.13 之前挂载也会登记，但工作进程共用创建者的 tracker，重复登记不会有问题。
+        """
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+        except TypeError:
+            return shared_memory.SharedMemory(name=name)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        """关闭本进程的映射；创建者还会删除共享内存块"""
+        self.array = None  # 先释放对缓冲区的引用，否则 close 会报 BufferError
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def sqrt_in_place(args):
+    """在共享数组的 [start, stop) 区间上原地开平方，返回这一段的和"""
+    shared, start, stop = args
+    part = shared.array[start:stop]
+    np.sqrt(part, out=part)
+    total = float(part.sum())
+    shared.close()
+    return total
+
+
+def sqrt_copy(part):
+    """对照组：数组切片经 pickle 拷贝到子进程，结果再拷贝回来"""
+    return np.sqrt(part)
+
+
+def example_shared_numpy(size=8 * 1024 * 1024, processes=4):
+    """示例5补充: 进程池在共享内存数组上分段原地计算"""
+    print("\n" + "="*60)
+    print(f"示例5补充: 共享内存 NumPy 数组 ({size * 8 // (1024*1024)} MB float64)")
+    print("="*60)
+    if np is None:
+        print("未安装 numpy，跳过（pip install numpy）")
+        return
+
+    bounds = np.linspace(0, size, processes * 4 + 1, dtype=np.int64)
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+    expected = float(np.sqrt(np.arange(size, dtype=np.float64)).sum())
+
+    # 先创建共享数组，再创建进程池（见 SharedArray 的说明）
+    with SharedArray(size, 'float64') as shared, mp.Pool(processes) as pool:
+        data = np.arange(size, dtype=np.float64)
+        start = time.perf_counter()
+        parts = pool.map(sqrt_copy, [data[a:b] for a, b in chunks])
+        data = np.concatenate(parts)
+        copy_time = time.perf_counter() - start
+        print(f"\n[切片经 pickle 传递] {copy_time:.2f} 秒（切片发过去、结果发回来、再拼接）")
+
+        shared.array[:] = np.arange(size, dtype=np.float64)
+        start = time.perf_counter()
+        totals = pool.map(sqrt_in_place, [(shared, a, b) for a, b in chunks])
+        shared_time = time.perf_counter() - start
+        print(f"[共享内存原地计算]   {shared_time:.2f} 秒（只传名字和区间，"
+              f"加速 {copy_time/shared_time:.1f}x）")
+        print(f"  共享内存块: {shared.name}，{len(chunks)} 个互不重叠的区间")
+        assert np.array_equal(shared.array, data)
+        assert abs(sum(totals) - expected) <= 1e-6 * expected
+
+    print("\n要点:")
+    print("- mp.Value / Array / Manager 适合少量数据，大数组每次传递都会被 pickle 拷贝")
+    print("- SharedMemory 上的 NumPy 数组只传名字，各进程直接读写同一块内存")
+    print("- 各进程处理互不重叠的区间，不需要加锁；用完由创建者 unlink")
+
+
 # ===== 主函数 =====
 def main():
     print("="*60)
@@ -232,9 +781,14 @@ def main():
     # 运行所有示例
     example_basic_process()
     example_queue_communication()
+    example_batch_queue()
     example_pipe_communication()
+    example_framed_pipe()
     example_process_pool()
+    example_streaming_pool()
     example_shared_memory()
+    example_sharded_counter()
+    example_shared_numpy()
     
     print("\n" + "="*60)
     print("所有示例完成！")
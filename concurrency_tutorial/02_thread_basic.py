@@ -6,6 +6,7 @@
 import threading
 import time
 import queue
+from collections import deque
 
 
 # ===== 示例1: 基本的线程创建 =====
@@ -110,7 +111,144 @@ def example_thread_lock():
     print(f"  {'✅ 正确！锁保证了线程安全' if counter == 500 else '❌ 错误'}")
 
 
+# ===== 示例2补充: 分片计数器 =====
+class ShardedCounter:
+    """多线程分片计数器：每个线程累加自己的单元格，读取时求和
+
+    单元格通过 threading.local 找到，只有第一次使用时为了登记单元格加一次锁；
+    之后每个单元格只被它的线程写，热路径上没有锁。
+    value() 读到的是近似实时的总数，所有线程结束后是精确值。
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._cells = []
+        self._register_lock = threading.Lock()
+
+    def _cell(self):
+        cell = [0]
+        with self._register_lock:
+            self._cells.append(cell)
+        self._local.cell = cell
+        return cell
+
+    def add(self, amount=1):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cell()
+        cell[0] += amount
+
+    def value(self):
+        with self._register_lock:
+            return sum(cell[0] for cell in self._cells)
+
+
+def increment_locked(count):
+    """对照组：和 increment_counter_safe 一样每次加一都加锁（去掉了模拟的处理时间）"""
+    global counter
+    for _ in range(count):
+        with counter_lock:
+            counter += 1
+
+
+def increment_sharded(sharded, count):
+    for _ in range(count):
+        sharded.add()
+
+
+def example_sharded_counter(num_threads=8, count=100000):
+    """示例2补充: 全局锁计数器 vs 分片计数器"""
+    print("\n" + "="*60)
+    print(f"示例2补充: 分片计数器 ({num_threads} 个线程 × {count} 次加一)")
+    print("="*60)
+    global counter
+
+    counter = 0
+    threads = [threading.Thread(target=increment_locked, args=(count,))
+               for _ in range(num_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    locked_time = time.perf_counter() - start
+    print(f"\n[全局锁]     {locked_time:.2f} 秒, 结果 {counter}")
+
+    sharded = ShardedCounter()
+    threads = [threading.Thread(target=increment_sharded, args=(sharded, count))
+               for _ in range(num_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sharded_time = time.perf_counter() - start
+    print(f"[分片计数器] {sharded_time:.2f} 秒, 结果 {sharded.value()} "
+          f"(加速 {locked_time/sharded_time:.1f}x)")
+    assert sharded.value() == counter == num_threads * count
+
+    print("\n要点:")
+    print("- 全局锁让所有线程在同一把锁上排队，每次加一都要获取和释放")
+    print("- 分片计数器的每个线程只改自己的单元格，读取时再合并")
+    print("- 适合写多读少的统计计数；需要精确的读-改-写事务时仍然要用锁")
+
+
 # ===== 示例3: 生产者-消费者模式 =====
+class BatchQueue:
+    """支持批量存取和关闭的线程队列
+
+    - put_many 一次放入多个元素，get_many 一次最多取出 max_items 个，锁和唤醒的开销按批分摊
+    - close() 立即唤醒所有等待的消费者；队列排空后 get_many 返回空列表，表示结束
+    - 关闭后再 put 会抛出 ValueError（与 mp.Queue 关闭后的行为一致）
+    """
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._items = deque()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def put(self, item, timeout=None):
+        self.put_many([item], timeout)
+
+    def put_many(self, items, timeout=None):
+        """放入多个元素；有容量上限时按剩余空间分段放入，满了就阻塞"""
+        items = list(items)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._not_full:
+            while items:
+                if self._closed:
+                    raise ValueError("队列已关闭")
+                space = len(items) if self.maxsize <= 0 else self.maxsize - len(self._items)
+                if space <= 0:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Full
+                    self._not_full.wait(remaining)
+                    continue
+                self._items.extend(items[:space])
+                del items[:space]
+                self._not_empty.notify_all()
+
+    def get_many(self, max_items=64, timeout=None):
+        """取出 1~max_items 个元素；关闭且排空后返回 []，超时抛出 queue.Empty"""
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._items or self._closed, timeout):
+                raise queue.Empty
+            batch = [self._items.popleft() for _ in range(min(max_items, len(self._items)))]
+            if batch:
+                self._not_full.notify_all()
+            return batch
+
+    def close(self):
+        """不再接受新元素，唤醒所有等待的生产者和消费者"""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+
 def producer_thread(q, items):
     """生产者线程"""
     thread_id = threading.get_ident()
@@ -123,18 +261,16 @@ def producer_thread(q, items):
 
 
 def consumer_thread(q, name):
-    """消费者线程"""
+    """消费者线程：一次最多取2个；队列关闭并取完后 get_many 返回空列表，立即退出"""
     thread_id = threading.get_ident()
     print(f"[消费者-{name} Thread: {thread_id}] 开始消费")
     while True:
-        try:
-            # 设置超时，避免无限等待
-            item = q.get(timeout=2)
+        batch = q.get_many(max_items=2)
+        if not batch:
+            break
+        for item in batch:
             print(f"  消费者-{name} 消费: {item}")
             time.sleep(0.5)
-            q.task_done()
-        except queue.Empty:
-            break
     print(f"[消费者-{name}] 完成")
 
 
@@ -144,8 +280,8 @@ def example_producer_consumer():
     print("示例3: 生产者-消费者模式")
     print("="*60)
     
-    # 创建队列
-    q = queue.Queue()
+    # 创建队列（支持批量取出和关闭，见下方 BatchQueue）
+    q = BatchQueue()
     
     items = ['任务1', '任务2', '任务3', '任务4', '任务5']
     
@@ -161,13 +297,102 @@ def example_producer_consumer():
     consumer1.start()
     consumer2.start()
     
-    # 等待完成
+    # 生产者完成后关闭队列，消费者取完剩余任务就退出，不需要等待超时
     producer.join()
-    q.join()  # 等待队列中的所有任务完成
+    q.close()
+    consumer1.join()
+    consumer2.join()
     
     print("生产者-消费者模式完成")
 
 
+# ===== 示例3补充: 批量队列的性能 =====
+def consumer_batch_thread(q, name, results):
+    """批量消费者：一次取一批，队列关闭并排空后立即退出"""
+    count = 0
+    while True:
+        batch = q.get_many(max_items=256)
+        if not batch:
+            break
+        count += len(batch)
+    results[name] = count
+
+
+def consumer_sentinel_thread(q, name, results):
+    """逐条消费者：每次 get 一个元素，收到 None 退出"""
+    count = 0
+    while True:
+        item = q.get()
+        if item is None:
+            break
+        count += 1
+    results[name] = count
+
+
+def example_batch_queue(num_items=200000, num_consumers=4):
+    """示例3补充: 批量队列 vs 逐条 queue.Queue"""
+    print("\n" + "="*60)
+    print(f"示例3补充: 批量队列 ({num_items} 个元素, {num_consumers} 个消费者)")
+    print("="*60)
+
+    # 逐条：queue.Queue + 每个消费者一个 None 结束信号
+    q = queue.Queue(maxsize=1000)
+    results = {}
+    consumers = [threading.Thread(target=consumer_sentinel_thread, args=(q, i, results))
+                 for i in range(num_consumers)]
+    start = time.perf_counter()
+    for t in consumers:
+        t.start()
+    for i in range(num_items):
+        q.put(i)
+    for _ in consumers:
+        q.put(None)
+    for t in consumers:
+        t.join()
+    single_time = time.perf_counter() - start
+    print(f"\n[逐条 queue.Queue] {single_time:.2f} 秒, {num_items/single_time:>9.0f} 个/秒, "
+          f"各消费者: {[results[i] for i in range(num_consumers)]}")
+
+    # 批量：put_many / get_many，生产完 close()
+    q = BatchQueue(maxsize=1000)
+    results = {}
+    consumers = [threading.Thread(target=consumer_batch_thread, args=(q, i, results))
+                 for i in range(num_consumers)]
+    start = time.perf_counter()
+    for t in consumers:
+        t.start()
+    for i in range(0, num_items, 256):
+        q.put_many(range(i, min(i + 256, num_items)))
+    q.close()
+    for t in consumers:
+        t.join()
+    batch_time = time.perf_counter() - start
+    print(f"[批量 BatchQueue]  {batch_time:.2f} 秒, {num_items/batch_time:>9.0f} 个/秒, "
+          f"各消费者: {[results[i] for i in range(num_consumers)]} "
+          f"(加速 {single_time/batch_time:.1f}x)")
+    assert sum(results.values()) == num_items
+
+    # 关闭延迟：消费者都在空队列上等待，close() 之后多久全部退出
+    q = BatchQueue()
+    results = {}
+    consumers = [threading.Thread(target=consumer_batch_thread, args=(q, i, results))
+                 for i in range(num_consumers)]
+    for t in consumers:
+        t.start()
+    time.sleep(0.1)
+    start = time.perf_counter()
+    q.close()
+    for t in consumers:
+        t.join()
+    print(f"\n[关闭] {num_consumers} 个等待中的消费者在 close() 后 "
+          f"{(time.perf_counter()-start)*1000:.2f}ms 内全部退出"
+          f"（用 get(timeout=2) 轮询判断结束要多等2秒）")
+
+    print("\n要点:")
+    print("- 一次加锁取一批，锁竞争和线程唤醒次数都按批大小下降")
+    print("- close() 用 notify_all 唤醒所有消费者，不需要为每个消费者放一个 None")
+
+
 # ===== 示例4: 线程池 =====
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
@@ -220,6 +445,7 @@ def example_thread_pool():
 
 # ===== 示例5: 信号量 Semaphore =====
 # 模拟资源池（如数据库连接池）
+# 完整的连接池（懒创建、空闲回收、获取超时、统计）见 05_real_world_examples.py 的 ConnectionPool
 semaphore = threading.Semaphore(3)  # 最多3个线程同时访问
 
 
@@ -343,7 +569,9 @@ def main():
     # 运行所有示例
     example_basic_thread()
     example_thread_lock()
+    example_sharded_counter()
     example_producer_consumer()
+    example_batch_queue()
     example_thread_pool()
     example_semaphore()
     example_event()
@@ -3,10 +3,15 @@
 对比进程、线程、协程在不同场景下的性能表现
 """
 
+import gc
+import importlib
+import os
+import sys
 import time
 import multiprocessing as mp
 import threading
 import asyncio
+from multiprocessing import forkserver
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 
@@ -307,6 +312,181 @@ def compare_resource_usage():
     print(f"协程比进程快: {process_create_time / coroutine_create_time:.1f}x")
 
 
+# ===== 场景5: 进程启动开销 - forkserver 预热 =====
+PRELOAD_MODULES = ('asyncio', 'hashlib', 'json', 'aiohttp')
+_WARM_ENV = 'CONCURRENCY_TUTORIAL_FORKSERVER_WARM'
+_WARM_DATASET = None  # forkserver 服务进程里预先构建的只读数据集
+_MODULE_NAME = os.path.splitext(os.path.basename(__file__))[0]
+
+
+def build_dataset(size):
+    """模拟工作进程需要的只读数据（如词表、模型参数、配置）"""
+    return {i: (f"item-{i}", i * i) for i in range(size)}
+
+
+def _forkserver_warm_up():
+    """在 forkserver 服务进程里执行：构建数据集，然后冻结 GC"""
+    global _WARM_DATASET
+    size, freeze = os.environ.pop(_WARM_ENV).split(',')  # 不再传给之后 fork 出的子进程
+    _WARM_DATASET = build_dataset(int(size))
+    if freeze == '1':
+        # 把现有对象移进永久代，之后子进程的 GC 不再扫描（写入）它们，页面保持共享
+        gc.freeze()
+
+
+def preloaded_dataset():
+    """取得服务进程预先构建的数据集；没有预热时返回 None
+
+    工作函数是从主脚本（__main__ / __mp_main__）里找到的，而数据集在按模块名预加载的
+    本文件里，所以要通过 sys.modules 按模块名去取。
+    """
+    return getattr(sys.modules.get(_MODULE_NAME), '_WARM_DATASET', None)
+
+
+def memory_usage():
+    """当前进程的共享/私有内存（MB），读取 /proc/self/smaps_rollup，仅 Linux 支持"""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if line.endswith('kB\n'))
+    except OSError:
+        return None, None
+    def kb(*names):
+        return sum(int(fields[n].split()[0]) for n in names)
+
+    return (kb('Shared_Clean', 'Shared_Dirty') / 1024,
+            kb('Private_Clean', 'Private_Dirty') / 1024)
+
+
+def startup_worker(conn, preload, dataset_size):
+    """导入需要的模块、拿到数据集、做一次查询，然后报告就绪"""
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    dataset = preloaded_dataset()
+    if dataset is None:
+        dataset = build_dataset(dataset_size)
+    gc.collect()
+    checksum = sum(dataset[k][1] for k in range(0, dataset_size, max(dataset_size // 1000, 1)))
+    conn.send((checksum, memory_usage()))
+    conn.recv()  # 等主进程通知退出，保证测量内存时其他工作进程都还活着
+    conn.close()
+
+
+class ForkserverLauncher:
+    """基于 forkserver 的进程启动器
+
+    forkserver 服务进程启动时先导入 preload 里的模块；dataset_size 大于0时还会按模块名
+    导入本文件并构建只读数据集，freeze=True 时再调用 gc.freeze()。之后每个工作进程都从
+    这个已经预热好的服务进程 fork 出来：不用重新导入模块，数据集页面与服务进程共享。
+    （预加载 '__main__' 在 Python 3.11 等版本上不生效，所以按文件名作为模块名导入。）
+    """
+    def __init__(self, preload=PRELOAD_MODULES, dataset_size=0, freeze=True):
+        self.ctx = mp.get_context('forkserver')
+        self.preload = list(preload)
+        self.dataset_size = dataset_size
+        self.freeze = freeze
+
+    def start(self):
+        """启动并预热服务进程（preload 只在服务进程启动时生效）
+
+        服务进程已经在运行时（本进程之前用过 forkserver），ensure_running() 不会重启它，
+        preload 会被静默忽略，所以直接报错，需要先调用 shutdown()。
+        """
+        if forkserver._forkserver._forkserver_pid is not None:
+            raise RuntimeError("forkserver 服务进程已经在运行，preload 不会生效；请先调用 shutdown()")
+        modules = ([_MODULE_NAME] if self.dataset_size else []) + self.preload
+        self.ctx.set_forkserver_preload(modules)
+        os.environ[_WARM_ENV] = f"{self.dataset_size},{int(self.freeze)}"
+        try:
+            forkserver.ensure_running()
+        finally:
+            del os.environ[_WARM_ENV]  # 只让服务进程看到，不影响之后 spawn 的进程
+        # 服务进程是异步预热的，先启动一个空进程，等预热完成后再开始计时
+        p = self.ctx.Process(target=time.sleep, args=(0,))
+        p.start()
+        p.join()
+        return self
+
+    def Process(self, *args, **kwargs):
+        return self.ctx.Process(*args, **kwargs)
+
+    def Pool(self, *args, **kwargs):
+        return self.ctx.Pool(*args, **kwargs)
+
+    def shutdown(self):
+        """停止服务进程，下次 start() 会按新的配置重新启动
+        （标准库没有公开的停止接口，这里用的是 forkserver 模块内部的 _stop）"""
+        forkserver._forkserver._stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def measure_startup(ctx, num_workers, dataset_size):
+    """依次启动工作进程，返回每个进程从 start() 到就绪的延迟和内存占用"""
+    latencies, memory, pipes, workers = [], [], [], []
+    for _ in range(num_workers):
+        parent_conn, child_conn = mp.Pipe()
+        p = ctx.Process(target=startup_worker, args=(child_conn, PRELOAD_MODULES, dataset_size))
+        start = time.perf_counter()
+        p.start()
+        checksum, usage = parent_conn.recv()
+        latencies.append(time.perf_counter() - start)
+        memory.append(usage)
+        pipes.append(parent_conn)
+        workers.append(p)
+    for conn in pipes:
+        conn.send('stop')
+    for p in workers:
+        p.join()
+    return latencies, memory
+
+
+def compare_worker_startup(num_workers=4, dataset_size=300000):
+    """对比 spawn 冷启动与 forkserver 预热启动"""
+    print("\n" + "="*60)
+    print("场景5: 进程启动开销（spawn 冷启动 vs forkserver 预热）")
+    print("="*60)
+    print(f"每个工作进程需要: 导入 {', '.join(PRELOAD_MODULES)}，"
+          f"以及 {dataset_size} 条记录的只读数据集")
+    if 'forkserver' not in mp.get_all_start_methods():
+        print("当前平台不支持 forkserver（如 Windows），跳过")
+        return
+
+    print(f"\n{'启动方式':<34}{'平均延迟':>10}{'最大延迟':>10}{'共享内存':>10}{'私有内存':>10}")
+
+    def report(label, latencies, memory):
+        shared = [m[0] for m in memory if m[0] is not None]
+        private = [m[1] for m in memory if m[1] is not None]
+        mem = (f"{sum(shared)/len(shared):>8.1f}MB{sum(private)/len(private):>8.1f}MB"
+               if shared else f"{'-':>10}{'-':>10}")
+        print(f"{label:<34}{sum(latencies)/len(latencies)*1000:>8.1f}ms"
+              f"{max(latencies)*1000:>8.1f}ms{mem}")
+
+    report("spawn（每个进程重新导入并构建）",
+           *measure_startup(mp.get_context('spawn'), num_workers, dataset_size))
+    for freeze in (False, True):
+        with ForkserverLauncher(dataset_size=dataset_size, freeze=freeze) as launcher:
+            label = "forkserver 预加载 + 数据集" + (" + gc.freeze" if freeze else "")
+            report(label, *measure_startup(launcher, num_workers, dataset_size))
+
+    print("\n要点:")
+    print("- spawn 每次都启动新解释器，重新导入模块、重新构建数据")
+    print("- forkserver 只预热一次，之后每个工作进程都是从它 fork 出来的，不用再导入和构建")
+    print("- 数据集页面与服务进程共享（写时复制）；gc.freeze() 让子进程的 GC 不再写这些对象，")
+    print("  共享的页面就不会因为 GC 被复制成私有页面")
+
+
+if __name__ == _MODULE_NAME and os.environ.get(_WARM_ENV):
+    # forkserver 服务进程按 preload 导入本文件时执行预热
+    _forkserver_warm_up()
+
+
 # ===== 主函数 =====
 def main():
     print("="*60)
@@ -325,6 +505,9 @@ def main():
     # 场景4: 资源占用
     compare_resource_usage()
     
+    # 场景5: 进程启动开销
+    compare_worker_startup()
+    
     # 最终建议
     print("\n" + "="*60)
     print("最终建议")
@@ -3,15 +3,35 @@
 展示进程、线程、协程在实际应用中的使用
 """
 
+import sys
 import time
 import asyncio
 import multiprocessing as mp
 import threading
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import queue
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor, Future, as_completed,
+                                wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError)
 import hashlib
 import json
+import mmap
+import os
+import random
+import sqlite3
+import struct
+import tempfile
+import tracemalloc
+import traceback
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from itertools import islice
+from multiprocessing import shared_memory
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，只有列式批处理示例需要
+    np = None
+
 
 # ===== 场景1: Web爬虫 (协程最优) =====
 async def fetch_page_async(url, session_id):
@@ -105,11 +125,11 @@ def compare_web_scraping():
 
 
 # ===== 场景2: 图像处理 (多进程最优) =====
-def process_image(image_id):
+def process_image(image_id, iterations=1000000):
     """CPU密集型：处理图像（模拟）"""
     # 模拟复杂的图像处理算法
     result = 0
-    for i in range(1000000):
+    for i in range(iterations):
         result += hashlib.md5(f"{image_id}_{i}".encode()).digest()[0]
     
     return {
@@ -119,14 +139,25 @@ def process_image(image_id):
     }
 
 
-def image_processor_process(image_ids):
-    """多进程版图像处理"""
+def image_processor_process(image_ids, journal=None):
+    """多进程版图像处理（传入 journal 时跳过已完成的图片，并记录新完成的）"""
     print("\n[多进程处理] 开始处理 {} 张图片...".format(len(image_ids)))
     start = time.time()
     
+    finished = journal.completed() if journal is not None else {}
+    pending = [i for i in image_ids if i not in finished]
+    if journal is not None:
+        print(f"[多进程处理] 从检查点恢复，跳过 {len(image_ids) - len(pending)} 张已完成的图片")
+    
     cpu_count = mp.cpu_count()
     with ProcessPoolExecutor(max_workers=cpu_count) as executor:
-        results = list(executor.map(process_image, image_ids))
+        futures = {executor.submit(process_image, i): i for i in pending}
+        for future in as_completed(futures):
+            image_id = futures[future]
+            finished[image_id] = future.result()
+            if journal is not None:
+                journal.mark_done(image_id, finished[image_id])
+    results = [finished[i] for i in image_ids]
     
     duration = time.time() - start
     print(f"[多进程处理] 完成！处理 {len(results)} 张图片")
@@ -151,6 +182,154 @@ def image_processor_thread(image_ids):
     return results, duration
 
 
+class ResultCache:
+    """内容寻址结果缓存：内存LRU层 + 磁盘共享层
+
+    键是输入内容和处理参数的哈希，相同的图片+参数一定命中同一条缓存。
+    磁盘层采用"写临时文件 + os.replace 原子替换"，多个进程并发读写也不会读到半个文件。
+    """
+    def __init__(self, cache_dir, max_items=128):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_items = max_items
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(payload, params):
+        """根据输入内容和处理参数生成缓存键"""
+        blob = json.dumps([payload, params], sort_keys=True).encode()
+        return hashlib.sha256(blob).hexdigest()
+
+    def _remember(self, key, value):
+        """放入内存层，超出容量时淘汰最久未使用的条目"""
+        with self.lock:
+            self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_items:
+                self.memory.popitem(last=False)
+
+    def get(self, key):
+        """先查内存，再查磁盘；都没有返回None"""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return self.memory[key]
+        value = read_disk_cache(self.cache_dir, key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value, persist=True):
+        """写入内存层；persist=True 时同时写入磁盘层（磁盘层已由工作进程写好时传 False）"""
+        self._remember(key, value)
+        if persist:
+            write_disk_cache(self.cache_dir, key, value)
+
+
+def read_disk_cache(cache_dir, key):
+    """读取磁盘缓存（文件不存在或损坏时返回None）"""
+    path = Path(cache_dir) / key[:2] / f"{key}.json"
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_disk_cache(cache_dir, key, value):
+    """原子写入磁盘缓存：先写临时文件，再 os.replace 到目标路径"""
+    path = Path(cache_dir) / key[:2] / f"{key}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def process_image_cached(image_id, params, cache_dir):
+    """进程池中执行：先查共享磁盘层，未命中再计算并回写"""
+    key = ResultCache.make_key(image_id, params)
+    value = read_disk_cache(cache_dir, key)
+    if value is None:
+        value = process_image(image_id, **params)
+        write_disk_cache(cache_dir, key, value)
+    return value
+
+
+def image_processor_cached(image_ids, cache, params=None):
+    """带缓存的多进程图像处理：命中的结果在派发前直接返回，不走进程间通信"""
+    params = params or {'iterations': 1000000}
+    start = time.time()
+
+    keys = [ResultCache.make_key(image_id, params) for image_id in image_ids]
+    results = {}
+    pending = {}  # key -> image_id，同一批里的重复图片只派发一次
+    for image_id, key in zip(image_ids, keys):
+        if key in results or key in pending:
+            continue
+        value = cache.get(key)
+        if value is not None:
+            results[key] = value
+        else:
+            pending[key] = image_id
+
+    if pending:
+        cpu_count = mp.cpu_count()
+        with ProcessPoolExecutor(max_workers=min(cpu_count, len(pending))) as executor:
+            computed = executor.map(process_image_cached, pending.values(),
+                                    [params] * len(pending),
+                                    [str(cache.cache_dir)] * len(pending))
+            for key, value in zip(pending, computed):
+                cache.put(key, value, persist=False)  # 磁盘层已由工作进程写入
+                results[key] = value
+
+    duration = time.time() - start
+    return [results[key] for key in keys], len(pending), duration
+
+
+def cached_image_processing_demo():
+    """演示内容寻址缓存"""
+    print("\n" + "="*60)
+    print("场景2补充: 内容寻址结果缓存 (重复图片)")
+    print("="*60)
+
+    # 24张图片，其中只有4张内容不同
+    image_ids = [i % 4 + 1 for i in range(24)]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ResultCache(cache_dir)
+
+        results, dispatched, cold_time = image_processor_cached(image_ids, cache)
+        print(f"\n[冷缓存] 处理 {len(results)} 张图片，派发 {dispatched} 个任务，耗时: {cold_time:.2f} 秒")
+
+        results, dispatched, warm_time = image_processor_cached(image_ids, cache)
+        print(f"[热缓存] 处理 {len(results)} 张图片，派发 {dispatched} 个任务，耗时: {warm_time:.4f} 秒")
+
+        # 新的缓存对象模拟另一个进程：内存层为空，但可以共享磁盘层
+        other = ResultCache(cache_dir)
+        results, dispatched, disk_time = image_processor_cached(image_ids, other)
+        print(f"[磁盘层] 处理 {len(results)} 张图片，派发 {dispatched} 个任务，耗时: {disk_time:.4f} 秒")
+        print(f"\n内存命中: {cache.memory_hits}, 磁盘命中: {other.disk_hits}")
+
+    print("\n要点:")
+    print("- 缓存键 = hash(输入内容 + 处理参数)，参数变化自动失效")
+    print("- 命中在派发前完成，省掉序列化和进程间通信")
+    print("- 磁盘层原子写入，多个进程可以安全共享")
+
+
 def compare_image_processing():
     """对比图像处理"""
     print("\n" + "="*60)
@@ -181,65 +360,92 @@ def compare_image_processing():
 # ===== 场景3: 数据库批量操作 (多线程合适) =====
 class MockDatabase:
     """模拟数据库"""
-    def __init__(self):
+    def __init__(self, latency=0.1, max_batch_size=1000):
         self.data = {}
         self.lock = threading.Lock()
+        self.latency = latency                # 每次网络往返的延迟
+        self.max_batch_size = max_batch_size  # 单次批量写入的最大行数
+        self.round_trips = 0
     
     def insert(self, key, value):
         """插入数据（模拟I/O）"""
-        time.sleep(0.1)  # 模拟网络延迟
+        time.sleep(self.latency)  # 模拟网络延迟
         with self.lock:
             self.data[key] = value
+            self.round_trips += 1
         return True
     
     def batch_insert(self, items):
-        """批量插入"""
-        for key, value in items:
-            self.insert(key, value)
+        """批量插入：每批只付一次网络往返、只加一次锁
+
+        items 可以是任意 (key, value) 可迭代对象，按 max_batch_size 切分。
+        """
+        items = iter(items)
+        total = 0
+        while True:
+            batch = list(islice(items, self.max_batch_size))
+            if not batch:
+                break
+            time.sleep(self.latency)  # 整批一次往返
+            with self.lock:
+                self.data.update(batch)
+                self.round_trips += 1
+            total += len(batch)
+        return total
 
 
 db = MockDatabase()
 
 
-def insert_batch(batch_id, records):
-    """插入一批记录"""
+def make_rows(batch_id, records):
+    """生成一批待插入的 (key, value)"""
     for record_id in records:
         key = f"batch_{batch_id}_record_{record_id}"
         value = {'id': record_id, 'data': f"Data {record_id}"}
+        yield key, value
+
+
+def insert_batch(batch_id, records, bulk=False):
+    """插入一批记录（bulk=True 时走批量接口）"""
+    if bulk:
+        return db.batch_insert(make_rows(batch_id, records))
+    for key, value in make_rows(batch_id, records):
         db.insert(key, value)
     return len(records)
 
 
-def database_operations_serial(batches):
+def database_operations_serial(batches, bulk=False):
     """串行数据库操作"""
-    print("\n[串行操作] 开始插入数据...")
+    mode = "批量" if bulk else "逐行"
+    print(f"\n[串行操作-{mode}] 开始插入数据...")
     start = time.time()
     
     for batch_id, records in enumerate(batches):
-        insert_batch(batch_id, records)
+        insert_batch(batch_id, records, bulk)
     
     duration = time.time() - start
     total_records = sum(len(b) for b in batches)
-    print(f"[串行操作] 完成！插入 {total_records} 条记录")
-    print(f"[串行操作] 耗时: {duration:.2f} 秒")
+    print(f"[串行操作-{mode}] 完成！插入 {total_records} 条记录")
+    print(f"[串行操作-{mode}] 耗时: {duration:.2f} 秒, 吞吐: {total_records/duration:.0f} 条/秒")
     
     return duration
 
 
-def database_operations_thread(batches):
+def database_operations_thread(batches, bulk=False):
     """多线程数据库操作"""
-    print("\n[多线程操作] 开始插入数据...")
+    mode = "批量" if bulk else "逐行"
+    print(f"\n[多线程操作-{mode}] 开始插入数据...")
     start = time.time()
     
     with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = [executor.submit(insert_batch, i, records) 
+        futures = [executor.submit(insert_batch, i, records, bulk) 
                    for i, records in enumerate(batches)]
         results = [f.result() for f in futures]
     
     duration = time.time() - start
     total_records = sum(results)
-    print(f"[多线程操作] 完成！插入 {total_records} 条记录")
-    print(f"[多线程操作] 耗时: {duration:.2f} 秒")
+    print(f"[多线程操作-{mode}] 完成！插入 {total_records} 条记录")
+    print(f"[多线程操作-{mode}] 耗时: {duration:.2f} 秒, 吞吐: {total_records/duration:.0f} 条/秒")
     
     return duration
 
@@ -253,166 +459,2686 @@ def compare_database_operations():
     # 准备数据：5批，每批10条记录
     batches = [list(range(i*10, (i+1)*10)) for i in range(5)]
     
-    # 串行操作
-    serial_time = database_operations_serial(batches)
-    
-    # 重置数据库
-    db.data.clear()
-    
-    # 多线程操作
-    thread_time = database_operations_thread(batches)
+    timings = {}
+    for label, func, bulk in [("串行-逐行", database_operations_serial, False),
+                              ("多线程-逐行", database_operations_thread, False),
+                              ("串行-批量", database_operations_serial, True),
+                              ("多线程-批量", database_operations_thread, True)]:
+        # 重置数据库
+        db.data.clear()
+        db.round_trips = 0
+        timings[label] = func(batches, bulk)
+        print(f"  网络往返次数: {db.round_trips}")
     
     # 对比
+    serial_time = timings["串行-逐行"]
     print("\n" + "="*60)
     print("数据库操作总结:")
     print("="*60)
-    print(f"串行:     {serial_time:.2f} 秒")
-    print(f"多线程:   {thread_time:.2f} 秒 ✅ 推荐")
-    print(f"性能提升: {serial_time/thread_time:.2f}x")
+    for label, duration in timings.items():
+        print(f"{label:<8} {duration:.2f} 秒 (加速 {serial_time/duration:.2f}x)")
     print("\n原因:")
     print("- 数据库操作是I/O密集型")
     print("- 多线程可以充分利用等待时间")
-    print("- 实现简单，易于维护")
+    print("- 批量接口把N次往返合并成1次，比加线程更有效")
+    print("- 两者可以叠加：多线程 + 批量写入")
+
+
+class Histogram:
+    """简单的分桶直方图（单位：秒，桶边界按毫秒划分）"""
+    BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        index = len(self.BOUNDS_MS)
+        for i, bound in enumerate(self.BOUNDS_MS):
+            if ms <= bound:
+                index = i
+                break
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """返回第p百分位所在桶的上界（毫秒）"""
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and i < len(self.BOUNDS_MS):
+                return min(self.BOUNDS_MS[i], self.max * 1000)
+        return self.max * 1000
+
+    def summary(self):
+        mean_ms = self.total / self.count * 1000 if self.count else 0.0
+        return (f"n={self.count} 平均={mean_ms:.1f}ms "
+                f"p50<={self.percentile(50):.0f}ms p95<={self.percentile(95):.0f}ms "
+                f"最大={self.max*1000:.1f}ms")
+
+
+class PoolTimeout(Exception):
+    """在超时时间内没有拿到连接"""
+
+
+class MockConnection:
+    """模拟数据库连接"""
+    def __init__(self, db, conn_id):
+        self.db = db
+        self.conn_id = conn_id
+        self.checked_out_at = 0.0
+
+    def insert(self, key, value):
+        return self.db.insert(key, value)
+
+    def batch_insert(self, items):
+        return self.db.batch_insert(items)
+
+
+class ConnectionPool:
+    """有界连接池：最小/最大连接数、懒创建、空闲回收、获取超时
+
+    同时记录等待时间、借出时长直方图和连接利用率，用于根据数据确定池大小。
+    """
+    def __init__(self, db, min_size=1, max_size=5, connect_cost=0.05, idle_timeout=30.0):
+        self.db = db
+        self.min_size = min_size
+        self.max_size = max_size
+        self.connect_cost = connect_cost  # 模拟建立连接的开销
+        self.idle_timeout = idle_timeout
+        self.cond = threading.Condition()
+        self.idle = deque()  # (连接, 归还时间)，右端是最近归还的
+        self.size = 0
+        self.in_use = 0
+        self.next_id = 0
+        # 统计
+        self.wait_hist = Histogram()
+        self.checkout_hist = Histogram()
+        self.connects = 0
+        self.timeouts = 0
+        self.started = time.monotonic()
+        self.busy_area = 0.0  # in_use 对时间的积分
+        self.last_change = self.started
+        for _ in range(min_size):
+            self.size += 1
+            self.idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        time.sleep(self.connect_cost)
+        with self.cond:
+            self.next_id += 1
+            self.connects += 1
+            conn_id = self.next_id
+        return MockConnection(self.db, conn_id)
+
+    def _account(self, delta):
+        """更新借出数量，并累计利用率（调用方持有锁）"""
+        now = time.monotonic()
+        self.busy_area += self.in_use * (now - self.last_change)
+        self.last_change = now
+        self.in_use += delta
+
+    def _reap_idle(self):
+        """关闭空闲过久的连接，但保留 min_size 个（调用方持有锁）"""
+        now = time.monotonic()
+        while self.idle and self.size > self.min_size:
+            conn, released_at = self.idle[0]
+            if now - released_at < self.idle_timeout:
+                break
+            self.idle.popleft()
+            self.size -= 1
+
+    def acquire(self, timeout=None):
+        """借出一个连接；timeout 秒内拿不到则抛出 PoolTimeout"""
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        create = False
+        with self.cond:
+            while True:
+                self._reap_idle()
+                if self.idle:
+                    conn, _ = self.idle.pop()  # 后进先出，优先复用热连接
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    create = True
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"{timeout}秒内没有可用连接")
+                self.cond.wait(remaining)
+            self._account(+1)
+
+        if create:
+            try:
+                conn = self._connect()  # 在锁外建立连接，不阻塞其他线程
+            except BaseException:
+                with self.cond:
+                    self.size -= 1
+                    self._account(-1)
+                    self.cond.notify()
+                raise
+
+        now = time.monotonic()
+        with self.cond:
+            self.wait_hist.record(now - start)
+        conn.checked_out_at = now
+        return conn
+
+    def release(self, conn):
+        """归还连接"""
+        now = time.monotonic()
+        with self.cond:
+            self.checkout_hist.record(now - conn.checked_out_at)
+            self._account(-1)
+            self.idle.append((conn, now))
+            self.cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """with pool.connection() as conn: ..."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def utilization(self):
+        """按时间加权的平均利用率（借出连接数 / 最大连接数）"""
+        with self.cond:
+            now = time.monotonic()
+            area = self.busy_area + self.in_use * (now - self.last_change)
+            elapsed = now - self.started
+        return area / (elapsed * self.max_size) if elapsed > 0 else 0.0
+
+    def report(self):
+        print(f"  连接数: {self.size}/{self.max_size} (共建立 {self.connects} 次), "
+              f"超时: {self.timeouts}, 利用率: {self.utilization():.0%}")
+        print(f"  等待时间: {self.wait_hist.summary()}")
+        print(f"  借出时长: {self.checkout_hist.summary()}")
+
+
+def insert_batch_pooled(pool, batch_id, records, timeout=None):
+    """从连接池借连接，逐行插入一批记录"""
+    for key, value in make_rows(batch_id, records):
+        with pool.connection(timeout) as conn:
+            conn.insert(key, value)
+    return len(records)
+
+
+def connection_pool_demo():
+    """演示连接池以及如何根据统计数据选择池大小"""
+    print("\n" + "="*60)
+    print("场景3补充: 有界连接池 (20个线程 × 10条记录)")
+    print("="*60)
+
+    batches = [list(range(i*10, (i+1)*10)) for i in range(20)]
+
+    for max_size in (2, 5, 10):
+        pool_db = MockDatabase(latency=0.02)
+        pool = ConnectionPool(pool_db, min_size=1, max_size=max_size, connect_cost=0.05)
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            futures = [executor.submit(insert_batch_pooled, pool, i, records)
+                       for i, records in enumerate(batches)]
+            total = sum(f.result() for f in futures)
+        duration = time.time() - start
+        print(f"\n[max_size={max_size}] 插入 {total} 条，耗时: {duration:.2f} 秒")
+        pool.report()
+
+    # 获取超时：池被占满时，短超时的请求会失败而不是无限等待
+    print("\n[获取超时] 1个连接被长时间占用，另一个线程只等待50ms:")
+    pool = ConnectionPool(MockDatabase(latency=0.02), min_size=1, max_size=1)
+    holder = pool.acquire()
+    try:
+        pool.acquire(timeout=0.05)
+    except PoolTimeout as e:
+        print(f"  捕获到 PoolTimeout: {e}")
+    finally:
+        pool.release(holder)
+
+    print("\n要点:")
+    print("- 等待时间p95高、利用率接近100% → 池太小")
+    print("- 利用率很低 → 池太大，浪费数据库连接")
+    print("- 获取超时可以防止请求在高峰期无限堆积")
+
+
+class AsyncMockConnection:
+    """模拟异步数据库连接：直接执行网络往返，不再经过连接池"""
+    def __init__(self, db, conn_id):
+        self.db = db
+        self.conn_id = conn_id
+
+    async def insert(self, key, value):
+        await asyncio.sleep(self.db.latency)
+        self.db.data[key] = value
+        self.db.round_trips += 1
+        return True
+
+    async def batch_insert(self, items):
+        items = list(items)
+        await asyncio.sleep(self.db.latency)
+        self.db.data.update(items)
+        self.db.round_trips += 1
+        return len(items)
+
+
+class AsyncConnectionPool:
+    """异步连接池：懒创建连接，借出数量受 max_size 限制"""
+    def __init__(self, db, max_size=5, connect_cost=0.05):
+        self.db = db
+        self.max_size = max_size
+        self.connect_cost = connect_cost
+        self.idle = []
+        self.size = 0
+        self.cond = asyncio.Condition()
+        self.wait_hist = Histogram()
+
+    async def acquire(self, timeout=None):
+        """借出一个连接；timeout 秒内拿不到则抛出 PoolTimeout"""
+        start = time.monotonic()
+        try:
+            conn = await asyncio.wait_for(self._acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f"{timeout}秒内没有可用连接") from None
+        self.wait_hist.record(time.monotonic() - start)
+        return conn
+
+    async def _acquire(self):
+        async with self.cond:
+            while not self.idle and self.size >= self.max_size:
+                await self.cond.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.size += 1
+        try:
+            await asyncio.sleep(self.connect_cost)  # 模拟建立连接，不阻塞事件循环
+        except BaseException:
+            async with self.cond:
+                self.size -= 1
+                self.cond.notify()
+            raise
+        return AsyncMockConnection(self.db, self.size)
+
+    async def release(self, conn):
+        async with self.cond:
+            self.idle.append(conn)
+            self.cond.notify()
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        """async with pool.connection() as conn: ..."""
+        conn = await self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+
+class AsyncMockDatabase:
+    """模拟数据库的异步版本：用 asyncio.sleep 模拟网络往返
+
+    所有操作都在同一个事件循环里执行，修改 data 不需要加锁。
+    """
+    def __init__(self, latency=0.1, max_batch_size=1000, pool_size=5, connect_cost=0.05):
+        self.data = {}
+        self.latency = latency
+        self.max_batch_size = max_batch_size
+        self.round_trips = 0
+        self.pool = AsyncConnectionPool(self, max_size=pool_size, connect_cost=connect_cost)
+
+    async def insert(self, key, value, timeout=None):
+        """插入数据：占用一个连接，付一次网络往返"""
+        async with self.pool.connection(timeout) as conn:
+            return await conn.insert(key, value)
+
+    async def bulk_insert(self, items, timeout=None):
+        """批量插入：按 max_batch_size 切分，每批占用一个连接、付一次往返"""
+        items = iter(items)
+        total = 0
+        while True:
+            batch = list(islice(items, self.max_batch_size))
+            if not batch:
+                break
+            async with self.pool.connection(timeout) as conn:
+                total += await conn.batch_insert(batch)
+        return total
+
+
+def run_db_workload_sync(database, batches, bulk, workers):
+    """同步版本：workers=1 为串行，否则用线程池，每个线程负责一批"""
+    def write(batch_id, records):
+        if bulk:
+            return database.batch_insert(make_rows(batch_id, records))
+        for key, value in make_rows(batch_id, records):
+            database.insert(key, value)
+        return len(records)
+
+    if workers == 1:
+        return sum(write(i, records) for i, records in enumerate(batches))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write, i, records) for i, records in enumerate(batches)]
+        return sum(f.result() for f in futures)
+
+
+async def run_db_workload_async(batches, bulk, workers, latency, max_batch_size):
+    """异步版本：每批一个协程，并发度由连接池大小限制"""
+    database = AsyncMockDatabase(latency=latency, max_batch_size=max_batch_size,
+                                 pool_size=workers, connect_cost=0)
+
+    async def write(batch_id, records):
+        if bulk:
+            return await database.bulk_insert(make_rows(batch_id, records))
+        for key, value in make_rows(batch_id, records):
+            await database.insert(key, value)
+        return len(records)
+
+    counts = await asyncio.gather(*[write(i, records) for i, records in enumerate(batches)])
+    return sum(counts)
+
+
+def compare_database_models(sizes=(50, 5000, 500000), latency=0.001, workers=5,
+                            max_batch_size=1000, per_row_limit=5000):
+    """同一份工作量分别用串行、多线程、协程执行，对比每行的开销"""
+    print("\n" + "="*60)
+    print("场景3补充: 串行 vs 多线程 vs 协程 数据库写入")
+    print("="*60)
+    print(f"每次往返延迟 {latency*1000:.0f}ms，并发度 {workers}，批大小 {max_batch_size}")
+
+    for size in sizes:
+        print(f"\n[{size} 条记录]")
+        batches = [range(i * size // workers, (i + 1) * size // workers) for i in range(workers)]
+        for bulk in (False, True):
+            mode = "批量" if bulk else "逐行"
+            if not bulk and size > per_row_limit:
+                print(f"  {mode}: 跳过（预计需要 {size*latency/workers:.0f} 秒以上）")
+                continue
+            runs = [
+                ("串行", lambda: run_db_workload_sync(
+                    MockDatabase(latency, max_batch_size), batches, bulk, 1)),
+                ("多线程", lambda: run_db_workload_sync(
+                    MockDatabase(latency, max_batch_size), batches, bulk, workers)),
+                ("协程", lambda: asyncio.run(run_db_workload_async(
+                    batches, bulk, workers, latency, max_batch_size))),
+            ]
+            for label, run in runs:
+                start = time.time()
+                total = run()
+                duration = time.time() - start
+                print(f"  {mode}-{label}: {duration:.3f} 秒, "
+                      f"{duration/total*1e6:.1f} 微秒/条, {total/duration:.0f} 条/秒")
+
+    print("\n要点:")
+    print("- 逐行写入时，每行开销主要是网络往返；多线程和协程都能把等待重叠起来")
+    print("- 协程不占线程，并发度只受连接池限制")
+    print("- 批量写入后，每行开销降到微秒级，剩下的是Python本身的处理成本")
+
+
+class ShardedMockDatabase:
+    """分片存储的模拟数据库：按 key 的哈希选择分片，每个分片有自己的锁和字典
+
+    接口与 MockDatabase 相同。写不同分片的线程不会互相阻塞。
+    hold_time 模拟持锁期间的存储引擎工作（如写页、维护索引）。
+    """
+    def __init__(self, num_shards=16, latency=0.1, max_batch_size=1000, hold_time=0.0):
+        self.num_shards = num_shards
+        self.shards = [{} for _ in range(num_shards)]
+        self.locks = [threading.Lock() for _ in range(num_shards)]
+        self.latency = latency
+        self.max_batch_size = max_batch_size
+        self.hold_time = hold_time
+
+    def shard_index(self, key):
+        return hash(key) % self.num_shards
+
+    def _write(self, index, rows):
+        with self.locks[index]:
+            if self.hold_time:
+                time.sleep(self.hold_time)
+            self.shards[index].update(rows)
+
+    def insert(self, key, value):
+        """插入数据（模拟I/O），只锁住 key 所在的分片"""
+        if self.latency:
+            time.sleep(self.latency)
+        self._write(self.shard_index(key), ((key, value),))
+        return True
+
+    def batch_insert(self, items):
+        """批量插入：每批一次往返，按分片分组后每个分片只加一次锁"""
+        items = iter(items)
+        total = 0
+        while True:
+            batch = list(islice(items, self.max_batch_size))
+            if not batch:
+                break
+            if self.latency:
+                time.sleep(self.latency)
+            groups = {}
+            for key, value in batch:
+                groups.setdefault(self.shard_index(key), []).append((key, value))
+            for index, rows in groups.items():
+                self._write(index, rows)
+            total += len(batch)
+        return total
+
+    def get(self, key, default=None):
+        index = self.shard_index(key)
+        with self.locks[index]:
+            return self.shards[index].get(key, default)
+
+    def clear(self):
+        for index in range(self.num_shards):
+            with self.locks[index]:
+                self.shards[index].clear()
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+
+def run_contention_benchmark(database, num_threads, rows_per_thread):
+    """多个线程同时写入（无网络延迟），返回每秒写入条数"""
+    barrier = threading.Barrier(num_threads + 1)
+
+    def writer(thread_id):
+        barrier.wait()
+        for i in range(rows_per_thread):
+            database.insert(f"t{thread_id}_r{i}", i)
+
+    threads = [threading.Thread(target=writer, args=(t,)) for t in range(num_threads)]
+    for t in threads:
+        t.start()
+    barrier.wait()  # 所有线程就绪后同时开始计时
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    duration = time.perf_counter() - start
+    assert len(database) == num_threads * rows_per_thread
+    return num_threads * rows_per_thread / duration
+
+
+def sharding_contention_benchmark(shard_counts=(1, 4, 16, 64), thread_counts=(1, 2, 4, 8)):
+    """分片数 × 线程数 的写入吞吐对比"""
+    print("\n" + "="*60)
+    print("场景3补充: 锁分片 (吞吐 vs 分片数 vs 线程数)")
+    print("="*60)
+    gil_check = getattr(sys, "_is_gil_enabled", None)
+    gil_enabled = gil_check() if gil_check else True
+    print(f"GIL: {'开启' if gil_enabled else '关闭（自由线程解释器）'}")
+
+    scenarios = [
+        ("纯内存写入（持锁时间极短）", 0.0, 5000),
+        ("持锁期间有100微秒存储引擎工作", 0.0001, 100),
+    ]
+    for title, hold_time, rows_per_thread in scenarios:
+        print(f"\n[{title}] 单位: 条/秒")
+        header = "分片数\\线程数 " + "".join(f"{n:>10}" for n in thread_counts)
+        print(header)
+        for shards in shard_counts:
+            cells = []
+            for threads in thread_counts:
+                database = ShardedMockDatabase(num_shards=shards, latency=0, hold_time=hold_time)
+                cells.append(run_contention_benchmark(database, threads, rows_per_thread))
+            print(f"{shards:>12} " + "".join(f"{c:>10.0f}" for c in cells))
+
+    print("\n要点:")
+    print("- 持锁期间有阻塞工作时，单锁让所有线程排队，分片后吞吐随线程数增长")
+    print("- 纯内存写入在有GIL的解释器上差别不大，锁本身不是瓶颈")
+    print("- 在自由线程解释器上，单锁会成为纯内存写入的瓶颈，分片的收益更明显")
+
+
+class WriteBehindBuffer:
+    """组提交写缓冲：写入方入队后立即拿到 Future，后台刷写线程把多个线程的行合并成批量写入
+
+    攒够 max_batch 行或等待超过 max_delay 秒就提交一批，整批写入成功后 Future 才完成。
+    """
+    _STOP = object()
+
+    def __init__(self, database, max_batch=500, max_delay=0.005):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.batches = 0
+        self.rows = 0
+        self.flusher = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self.flusher.start()
+
+    def submit(self, key, value):
+        """提交一行，返回在该行写入完成后完成的 Future"""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("WriteBehindBuffer 已关闭")
+            self.queue.put((key, value, future))
+        return future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is self._STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            self.database.batch_insert((key, value) for key, value, _ in batch)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+        else:
+            self.batches += 1
+            self.rows += len(batch)
+            for _, _, future in batch:
+                future.set_result(True)
+
+    def close(self):
+        """停止接收新数据，等待已提交的行全部写完"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(self._STOP)
+        self.flusher.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def group_commit_demo(writer_counts=(5, 20, 50), rows_per_writer=20):
+    """对比：每个线程直接逐行写入（连接池限制5个连接） vs 组提交"""
+    print("\n" + "="*60)
+    print("场景3补充: 组提交写缓冲 (write-behind)")
+    print("="*60)
+    latency = 0.01
+    print(f"每次往返 {latency*1000:.0f}ms，直接写入使用5个连接的连接池，组提交只用1个刷写线程")
+
+    def direct_writer(pool, writer_id):
+        for i in range(rows_per_writer):
+            with pool.connection() as conn:
+                conn.insert(f"w{writer_id}_r{i}", i)
+
+    def buffered_writer(buffer, writer_id):
+        for i in range(rows_per_writer):
+            # 和直接写入一样，等到这一行落盘后再写下一行
+            buffer.submit(f"w{writer_id}_r{i}", i).result()
+
+    for writers in writer_counts:
+        total = writers * rows_per_writer
+        print(f"\n[{writers} 个写线程，共 {total} 条]")
+
+        database = MockDatabase(latency=latency)
+        pool = ConnectionPool(database, min_size=5, max_size=5, connect_cost=0)
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            list(executor.map(lambda w: direct_writer(pool, w), range(writers)))
+        duration = time.time() - start
+        print(f"  直接写入: {duration:.2f} 秒, {total/duration:.0f} 条/秒, "
+              f"往返 {database.round_trips} 次")
+
+        database = MockDatabase(latency=latency)
+        start = time.time()
+        with WriteBehindBuffer(database) as buffer:
+            with ThreadPoolExecutor(max_workers=writers) as executor:
+                list(executor.map(lambda w: buffered_writer(buffer, w), range(writers)))
+        duration = time.time() - start
+        print(f"  组提交:   {duration:.2f} 秒, {total/duration:.0f} 条/秒, "
+              f"往返 {database.round_trips} 次, 平均每批 {buffer.rows/buffer.batches:.1f} 条")
+
+    print("\n要点:")
+    print("- 直接写入的吞吐上限是 连接数 / 往返延迟，与写线程数无关")
+    print("- 组提交把同一时刻所有线程的写入合并成一次往返，吞吐随写线程数增长")
+    print("- 代价是每行多等最多 max_delay 的攒批时间")
+
+
+class ReadWriteLock:
+    """读写锁：多个读者可以同时持有，写者独占；有写者等待时新读者让路，避免写者饿死"""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self.cond:
+            while self.writer or self.writers_waiting:
+                self.cond.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.readers -= 1
+                if not self.readers:
+                    self.cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.cond:
+            self.writers_waiting += 1
+            while self.writer or self.readers:
+                self.cond.wait()
+            self.writers_waiting -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.writer = False
+                self.cond.notify_all()
+
+
+class ReadableMockDatabase(MockDatabase):
+    """带读路径的模拟数据库：读写锁 + 有界读穿透LRU缓存
+
+    get/multi_get 命中缓存时不访问存储；未命中时在读锁下读取（模拟 read_cost 的磁盘/网络读取），
+    多个读者可以同时进行。写入在写锁下进行，并让缓存中对应的 key 失效。
+    """
+    def __init__(self, latency=0.1, max_batch_size=1000, read_cost=0.0001, cache_size=1024):
+        super().__init__(latency, max_batch_size)
+        self.rwlock = ReadWriteLock()
+        self.read_cost = read_cost
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _cache_get(self, key):
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return True, self.cache[key]
+            self.cache_misses += 1
+            return False, None
+
+    def _cache_put(self, key, value):
+        with self.cache_lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _invalidate(self, keys):
+        with self.cache_lock:
+            for key in keys:
+                self.cache.pop(key, None)
+
+    def insert(self, key, value):
+        """插入数据：写锁独占，写完后让缓存失效"""
+        time.sleep(self.latency)
+        with self.rwlock.write():
+            self.data[key] = value
+            self.round_trips += 1
+            self._invalidate((key,))
+        return True
+
+    def batch_insert(self, items):
+        """批量插入：每批一次往返、一次写锁"""
+        items = iter(items)
+        total = 0
+        while True:
+            batch = list(islice(items, self.max_batch_size))
+            if not batch:
+                break
+            time.sleep(self.latency)
+            with self.rwlock.write():
+                self.data.update(batch)
+                self.round_trips += 1
+                self._invalidate(key for key, _ in batch)
+            total += len(batch)
+        return total
+
+    def get(self, key, default=None):
+        """读取一个key（读穿透缓存）"""
+        found, value = self._cache_get(key)
+        if found:
+            return value
+        with self.rwlock.read():
+            if self.read_cost:
+                time.sleep(self.read_cost)
+            if key not in self.data:
+                return default
+            value = self.data[key]
+            # 在读锁内回填缓存：写者此时无法修改这个key，不会回填过期数据
+            self._cache_put(key, value)
+        return value
+
+    def multi_get(self, keys, default=None):
+        """批量读取：缓存未命中的key合并成一次存储读取"""
+        results = {}
+        missing = []
+        for key in keys:
+            found, value = self._cache_get(key)
+            if found:
+                results[key] = value
+            else:
+                missing.append(key)
+        if missing:
+            with self.rwlock.read():
+                if self.read_cost:
+                    time.sleep(self.read_cost)
+                for key in missing:
+                    if key in self.data:
+                        results[key] = self.data[key]
+                        self._cache_put(key, self.data[key])
+                    else:
+                        results[key] = default
+        return [results[key] for key in keys]
+
+
+class SingleLockReadDatabase(MockDatabase):
+    """对照组：沿用单把互斥锁，读也要独占，且没有缓存"""
+    def __init__(self, latency=0.1, max_batch_size=1000, read_cost=0.0001):
+        super().__init__(latency, max_batch_size)
+        self.read_cost = read_cost
+
+    def get(self, key, default=None):
+        with self.lock:
+            if self.read_cost:
+                time.sleep(self.read_cost)
+            return self.data.get(key, default)
+
+
+def mixed_read_write_benchmark(thread_counts=(1, 4, 16), ops_per_thread=200,
+                               read_ratio=0.95, num_keys=500):
+    """95%读 / 5%写 的混合负载，对比单锁、读写锁、读写锁+缓存"""
+    print("\n" + "="*60)
+    print("场景3补充: 读路径 (95%读 + 5%写)")
+    print("="*60)
+
+    def make_databases():
+        return [
+            ("单锁", SingleLockReadDatabase(latency=0)),
+            ("读写锁", ReadableMockDatabase(latency=0, cache_size=0)),
+            ("读写锁+缓存", ReadableMockDatabase(latency=0, cache_size=num_keys // 2)),
+        ]
+
+    def worker(database, seed):
+        rng = random.Random(seed)
+        for _ in range(ops_per_thread):
+            # 热点分布：大部分读取集中在少数key上
+            key = f"key_{min(int(rng.expovariate(1 / 50)), num_keys - 1)}"
+            if rng.random() < read_ratio:
+                database.get(key)
+            else:
+                database.insert(key, rng.random())
+
+    print(f"{'线程数':<8}" + "".join(f"{name:>14}" for name, _ in make_databases()) + "   (操作/秒)")
+    for threads in thread_counts:
+        cells = []
+        for name, database in make_databases():
+            database.batch_insert((f"key_{i}", i) for i in range(num_keys))
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(lambda seed: worker(database, seed), range(threads)))
+            duration = time.perf_counter() - start
+            cells.append(threads * ops_per_thread / duration)
+        print(f"{threads:<8}" + "".join(f"{c:>14.0f}" for c in cells))
+
+    print("\n要点:")
+    print("- 单锁让读者也排队，吞吐不随线程数增长")
+    print("- 读写锁允许多个读者同时读取存储，读多写少时吞吐随线程数增长")
+    print("- 读穿透缓存让热点key完全不碰存储，写入时让对应缓存失效")
 
 
 # ===== 场景4: 文件批量处理 (混合使用) =====
-def process_file(file_path):
-    """处理单个文件"""
-    # 模拟读取
-    time.sleep(0.05)
-    content = f"Content of {file_path}"
-    
-    # 模拟处理（CPU密集）
-    result = 0
-    for i in range(100000):
-        result += hash(f"{content}_{i}") % 1000
-    
-    # 模拟写入
-    time.sleep(0.05)
-    
+CHUNK_SIZE = 1024 * 1024  # 每次读取/哈希 1MB
+_thread_buffers = threading.local()
+
+
+def get_read_buffer(chunk_size=CHUNK_SIZE):
+    """每个线程（进程）复用同一块读缓冲区，避免每个分块都分配新的 bytes"""
+    buffer = getattr(_thread_buffers, 'buffer', None)
+    if buffer is None or len(buffer) != chunk_size:
+        buffer = _thread_buffers.buffer = bytearray(chunk_size)
+    return buffer
+
+
+def generate_corpus(root, num_files=16, file_size=8 * 1024 * 1024):
+    """在 root 下生成测试文件（已存在且大小一致的文件直接复用）"""
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(num_files):
+        path = root / f"file_{i:04d}.bin"
+        if not path.exists() or path.stat().st_size != file_size:
+            with open(path, 'wb') as f:
+                remaining = file_size
+                while remaining:
+                    n = min(remaining, CHUNK_SIZE)
+                    f.write(os.urandom(n))
+                    remaining -= n
+        paths.append(str(path))
+    return paths
+
+
+def hash_file(path, method='readinto', chunk_size=CHUNK_SIZE):
+    """按固定大小分块计算文件的 SHA-256，不构造整个文件的 bytes 副本
+
+    method='readinto': 读入复用的缓冲区
+    method='mmap':     映射文件，直接对映射区域的切片做哈希
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if method == 'mmap':
+            if size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                        memoryview(mm) as view:
+                    for offset in range(0, size, chunk_size):
+                        digest.update(view[offset:offset + chunk_size])
+        else:
+            buffer = get_read_buffer(chunk_size)
+            with memoryview(buffer) as view:
+                while True:
+                    n = f.readinto(view)
+                    if not n:
+                        break
+                    digest.update(view[:n])
+    return size, digest.hexdigest()
+
+
+def process_file(file_path, method='readinto', io_latency=0.0, hashed=None):
+    """处理单个文件：分块读取并计算哈希
+
+    io_latency > 0 时模拟远端存储：处理前拉取、处理后上传结果各等待一次。
+    hashed 是调用者已经算好的 (size, sha256)，传入后不再重复读取文件。
+    """
+    started = time.time()
+    if io_latency:
+        time.sleep(io_latency)  # 模拟拉取
+    size, sha256 = hashed if hashed is not None else hash_file(file_path, method)
+    if io_latency:
+        time.sleep(io_latency)  # 模拟上传结果
     return {
         'file': file_path,
-        'size': len(content),
-        'processed': result
+        'size': size,
+        'sha256': sha256,
+        'pid': os.getpid(),
+        'started': started,
+        'finished': time.time()
     }
 
 
-def file_processor_hybrid(files):
-    """混合方案：进程池 + 线程池"""
-    print("\n[混合方案] 使用进程池处理文件...")
+class FileManifest:
+    """持久化变更清单：path → (size, mtime, 内容哈希, 处理结果)
+
+    基于 SQLite 的 WAL 模式：多个工作进程可以同时写入，读者不会被写者阻塞。
+    每个进程、每个线程使用自己的连接（SQLite 连接不能跨线程或 fork 共享）。
+    """
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS manifest (
+                                path TEXT PRIMARY KEY,
+                                size INTEGER NOT NULL,
+                                mtime_ns INTEGER NOT NULL,
+                                sha256 TEXT NOT NULL,
+                                result TEXT NOT NULL)""")
+
+    def __getstate__(self):
+        return {'db_path': self.db_path}
+
+    def __setstate__(self, state):
+        self.db_path = state['db_path']
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, path):
+        row = self._connection().execute(
+            "SELECT size, mtime_ns, sha256, result FROM manifest WHERE path = ?",
+            (path,)).fetchone()
+        if row is None:
+            return None
+        return {'size': row[0], 'mtime_ns': row[1], 'sha256': row[2],
+                'result': json.loads(row[3])}
+
+    def unchanged(self, path):
+        """快速路径：size 和 mtime 都没变就信任清单，返回记录的结果；否则返回None"""
+        entry = self.get(path)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if st.st_size == entry['size'] and st.st_mtime_ns == entry['mtime_ns']:
+            return entry['result']
+        return None
+
+    def record(self, path, st, sha256, result):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?)",
+                         (path, st.st_size, st.st_mtime_ns, sha256, json.dumps(result)))
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM manifest").fetchone()[0]
+
+
+def process_file_tracked(file_path, method='readinto', io_latency=0.0, manifest=None,
+                         verify=False):
+    """带清单的文件处理：verify 模式下先重新计算哈希，内容没变就复用记录的结果"""
+    if manifest is None:
+        return process_file(file_path, method, io_latency)
+    st = os.stat(file_path)
+    hashed = None
+    if verify:
+        entry = manifest.get(file_path)
+        if entry is not None:
+            hashed = hash_file(file_path, method)
+            if hashed[1] == entry['sha256']:
+                # 只是 mtime 变了（如被 touch），内容没变：更新清单，不重新处理
+                manifest.record(file_path, st, hashed[1], entry['result'])
+                return dict(entry['result'], status='verified')
+    # 内容变了的文件直接复用刚算好的哈希，不再读第二遍
+    result = process_file(file_path, method, io_latency, hashed)
+    manifest.record(file_path, st, result['sha256'], result)
+    return dict(result, status='processed')
+
+
+def process_file_group(files, method='readinto', io_latency=0.0, io_concurrency=4,
+                       manifest=None, verify=False, progress=None):
+    """在一个工作进程内部用线程池处理一组文件，让多个文件的I/O等待互相重叠
+
+    传入 progress 队列时，每处理完一个文件就把结果放进去，主进程可以立即记录检查点。
+    """
+    def handle(f):
+        result = process_file_tracked(f, method, io_latency, manifest, verify)
+        if progress is not None:
+            progress.put(result)
+        return result
+
+    if io_concurrency <= 1:
+        return [handle(f) for f in files]
+    with ThreadPoolExecutor(max_workers=io_concurrency) as executor:
+        return list(executor.map(handle, files))
+
+
+def report_worker_throughput(results):
+    """按工作进程汇总：处理的文件数、字节数和 MB/s（按该进程的实际工作时间段计算）"""
+    workers = {}
+    for r in results:
+        stats = workers.setdefault(r['pid'], [0, 0, r['started'], r['finished']])
+        stats[0] += 1
+        stats[1] += r['size']
+        stats[2] = min(stats[2], r['started'])
+        stats[3] = max(stats[3], r['finished'])
+    for pid, (count, size, started, finished) in sorted(workers.items()):
+        mb = size / (1024 * 1024)
+        print(f"  [PID {pid}] {count} 个文件, {mb:.0f} MB, {mb/max(finished - started, 1e-9):.0f} MB/s")
+
+
+def file_processor_hybrid(files, method='readinto', processes=None, io_concurrency=4,
+                          io_latency=0.0, manifest=None, verify=False, journal=None):
+    """混合方案：进程池 + 线程池
+
+    外层进程池负责并行的CPU工作，每个进程内部再用 io_concurrency 个线程重叠I/O。
+    io_concurrency=1 时退化为只有进程池的版本。
+    传入 manifest 后只处理新增或变化的文件：默认信任 size+mtime，verify=True 时重新计算哈希。
+    传入 journal 后跳过上次中断前已完成的文件；工作进程每完成一个文件就通过
+    Manager 队列发回结果，主进程的记录线程立即写入检查点。
+    返回的结果与 files 顺序一致。
+    """
+    processes = processes or min(mp.cpu_count(), 4)
+    label = f"混合方案-{method} {processes}进程×{io_concurrency}线程"
+    print(f"\n[{label}] 开始处理文件...")
     start = time.time()
-    
-    # 使用进程池处理CPU密集的部分
-    cpu_count = min(mp.cpu_count(), 4)
-    with ProcessPoolExecutor(max_workers=cpu_count) as executor:
-        results = list(executor.map(process_file, files))
-    
+
+    results = []
+    pending = files
+    if manifest is not None and not verify:
+        # 快速路径在派发前完成，没变的文件不进入进程池
+        pending = []
+        for f in files:
+            cached = manifest.unchanged(f)
+            if cached is None:
+                pending.append(f)
+            else:
+                results.append(dict(cached, status='unchanged'))
+    if journal is not None:
+        done = journal.completed()
+        results.extend(dict(done[f], status='resumed') for f in pending if f in done)
+        pending = [f for f in pending if f not in done]
+
+    # 每组 io_concurrency*2 个文件，让组内线程都有活干；组数多于进程数，进程池可以动态均衡负载。
+    # 文件很少时缩小组，保证每个进程至少分到一组
+    group_size = max(min(io_concurrency * 2, -(-len(pending) // processes)), 1)
+    groups = [pending[i:i + group_size] for i in range(0, len(pending), group_size)]
+    if groups:
+        manager = progress = recorder = None
+        if journal is not None:
+            manager = mp.Manager()
+            progress = manager.Queue()
+
+            def record_progress():
+                while True:
+                    r = progress.get()
+                    if r is None:
+                        break
+                    journal.mark_done(r['file'], r)
+
+            recorder = threading.Thread(target=record_progress, name="checkpoint-recorder")
+            recorder.start()
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [executor.submit(process_file_group, group, method, io_latency,
+                                           io_concurrency, manifest, verify, progress)
+                           for group in groups]
+                for future in as_completed(futures):
+                    results.extend(future.result())
+        finally:
+            if recorder is not None:
+                progress.put(None)
+                recorder.join()
+                manager.shutdown()
+    # 各组按完成顺序返回，跳过的文件排在前面；按输入顺序重新排列
+    order = {f: i for i, f in enumerate(files)}
+    results.sort(key=lambda r: order[r['file']])
+
     duration = time.time() - start
-    print(f"[混合方案] 完成！处理 {len(results)} 个文件")
-    print(f"[混合方案] 耗时: {duration:.2f} 秒")
-    
+    processed = [r for r in results if r.get('status', 'processed') == 'processed']
+    total_mb = sum(r['size'] for r in processed) / (1024 * 1024)
+    skipped = len(results) - len(processed)
+    print(f"[{label}] 完成！处理 {len(processed)} 个文件, {total_mb:.0f} MB"
+          + (f", 跳过 {skipped} 个未变化或已完成的文件" if skipped else ""))
+    print(f"[{label}] 耗时: {duration:.2f} 秒, 总吞吐: {total_mb/max(duration, 1e-9):.0f} MB/s")
+    report_worker_throughput(processed)
+
     return results, duration
 
 
-def compare_file_processing():
+def compare_file_processing(num_files=16, file_size=8 * 1024 * 1024):
     """对比文件处理"""
     print("\n" + "="*60)
-    print("场景4: 文件批量处理 (16个文件)")
+    print(f"场景4: 文件批量处理 ({num_files}个文件 × {file_size // (1024*1024)}MB)")
     print("="*60)
-    
-    files = [f"file_{i}.txt" for i in range(16)]
-    
-    results, duration = file_processor_hybrid(files)
-    
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        files = generate_corpus(corpus_dir, num_files, file_size)
+
+        readinto_results, readinto_time = file_processor_hybrid(files, 'readinto')
+        mmap_results, mmap_time = file_processor_hybrid(files, 'mmap')
+        assert [r['sha256'] for r in readinto_results] == [r['sha256'] for r in mmap_results]
+
+        # 模拟远端存储（每个文件拉取+上传各50ms），对比进程内是否用线程重叠I/O
+        print("\n[模拟远端存储: 每个文件拉取、上传各 50ms]")
+        process_only_results, process_only_time = file_processor_hybrid(
+            files, io_concurrency=1, io_latency=0.05)
+        hybrid_results, hybrid_time = file_processor_hybrid(
+            files, io_concurrency=8, io_latency=0.05)
+
     print("\n" + "="*60)
     print("文件处理总结:")
     print("="*60)
-    print(f"混合方案: {duration:.2f} 秒")
+    print(f"readinto:          {readinto_time:.2f} 秒")
+    print(f"mmap:              {mmap_time:.2f} 秒")
+    print(f"仅进程池 (有I/O):  {process_only_time:.2f} 秒")
+    print(f"进程池+线程池:     {hybrid_time:.2f} 秒 (加速 {process_only_time/hybrid_time:.2f}x) ✅ 推荐")
     print("\n方案:")
     print("- 使用多进程处理CPU密集部分")
-    print("- 每个进程内部可以用线程处理I/O")
+    print("- 每个进程内部用线程池重叠I/O，进程数和每进程I/O并发度可以分别调节")
+    print("- 按固定大小分块读取，内存占用与文件大小无关")
     print("- 充分利用系统资源")
 
 
+def walk_files(root):
+    """用 os.scandir 流式遍历目录树，找到一个文件就产出一个，不预先列出整棵树"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path
+        except OSError:
+            continue  # 没有权限或目录已被删除，跳过
+
+
+def stream_directory_pipeline(root, sink, workers=4, queue_size=64,
+                              method='readinto', io_latency=0.0):
+    """流式目录处理管道：遍历线程 → 有界队列 → 工作线程池 → 结果回调 sink
+
+    队列满时遍历线程阻塞（背压），内存占用由 queue_size 决定，与目录树大小无关。
+    sink 或工作线程抛出异常时设置 stop：遍历停止，工作线程只排空队列，
+    所有线程都退出后再把异常抛给调用者。
+    """
+    path_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue(maxsize=queue_size)
+    done = object()
+    stop = threading.Event()
+    failures = []
+    stats = {'files': 0, 'bytes': 0, 'errors': 0, 'max_queue_depth': 0,
+             'first_result_after': None}
+    start = time.time()
+
+    def walker():
+        try:
+            for path in walk_files(root):
+                if stop.is_set():
+                    break
+                path_queue.put(path)  # 队列满时在这里等待
+                stats['max_queue_depth'] = max(stats['max_queue_depth'], path_queue.qsize())
+        except Exception as e:
+            failures.append(e)
+            stop.set()
+        finally:
+            for _ in range(workers):
+                path_queue.put(None)
+
+    def worker():
+        try:
+            while True:
+                path = path_queue.get()
+                if path is None:
+                    break
+                if stop.is_set():
+                    continue  # 已经出错，只排空队列
+                try:
+                    result = process_file(path, method, io_latency)
+                except OSError as e:
+                    result = {'file': path, 'error': str(e)}
+                except Exception as e:
+                    failures.append(e)
+                    stop.set()
+                    continue
+                result_queue.put(result)
+        finally:
+            result_queue.put(done)
+
+    threads = [threading.Thread(target=walker, name="walker")]
+    threads += [threading.Thread(target=worker, name=f"worker-{i}") for i in range(workers)]
+    for t in threads:
+        t.start()
+
+    # 结果汇总在当前线程进行
+    finished = 0
+    try:
+        while finished < workers:
+            result = result_queue.get()
+            if result is done:
+                finished += 1
+                continue
+            if stop.is_set():
+                continue
+            if stats['first_result_after'] is None:
+                stats['first_result_after'] = time.time() - start
+            if 'error' in result:
+                stats['errors'] += 1
+            else:
+                stats['files'] += 1
+                stats['bytes'] += result['size']
+            sink(result)
+    except BaseException:
+        stop.set()
+        while finished < workers:  # 继续排空结果队列，让阻塞在 put 上的线程都能退出
+            if result_queue.get() is done:
+                finished += 1
+        raise
+    finally:
+        for t in threads:
+            t.join()
+
+    if failures:
+        raise failures[0]
+    stats['duration'] = time.time() - start
+    return stats
+
+
+def streaming_walker_demo(num_dirs=40, files_per_dir=50, file_size=16 * 1024):
+    """对比：先列出全部文件再处理 vs 流式管道"""
+    print("\n" + "="*60)
+    print(f"场景4补充: 流式目录遍历管道 ({num_dirs}个目录 × {files_per_dir}个文件)")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as root:
+        for d in range(num_dirs):
+            generate_corpus(os.path.join(root, f"dir_{d:03d}"), files_per_dir, file_size)
+
+        # 先列出全部文件再处理
+        start = time.time()
+        files = [os.path.join(dirpath, name)
+                 for dirpath, _, names in os.walk(root) for name in names]
+        listed_after = time.time() - start
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            first = None
+            for _ in executor.map(process_file, files):
+                if first is None:
+                    first = time.time() - start
+        list_first_time = time.time() - start
+        print(f"\n[先列出再处理] 列出 {len(files)} 个文件用时 {listed_after*1000:.1f}ms，"
+              f"首个结果 {first*1000:.1f}ms，总耗时 {list_first_time:.2f} 秒")
+        print(f"  内存中同时存在的路径数: {len(files)}")
+
+        checksums = []
+        stats = stream_directory_pipeline(root, lambda r: checksums.append(r['sha256']),
+                                          workers=4, queue_size=32)
+        print(f"\n[流式管道] 处理 {stats['files']} 个文件 ({stats['bytes']/(1024*1024):.1f} MB)，"
+              f"首个结果 {stats['first_result_after']*1000:.1f}ms，总耗时 {stats['duration']:.2f} 秒")
+        print(f"  队列最大深度: {stats['max_queue_depth']} (上限 32)，错误: {stats['errors']}")
+
+    print("\n要点:")
+    print("- 遍历和处理同时进行，找到第一个文件就开始处理")
+    print("- 有界队列提供背压：处理跟不上时遍历自动暂停")
+    print("- 内存占用由队列大小决定，几百万个文件的目录树也不会撑爆内存")
+
+
+def incremental_processing_demo(num_files=16, file_size=4 * 1024 * 1024):
+    """演示基于变更清单的增量处理"""
+    print("\n" + "="*60)
+    print("场景4补充: 变更清单与增量处理")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        files = generate_corpus(os.path.join(workdir, "corpus"), num_files, file_size)
+        manifest = FileManifest(os.path.join(workdir, "manifest.sqlite"))
+
+        print("\n[第1次运行] 清单为空，处理全部文件")
+        _, first_time = file_processor_hybrid(files, io_latency=0.05, manifest=manifest)
+
+        print("\n[第2次运行] 没有文件变化")
+        _, second_time = file_processor_hybrid(files, io_latency=0.05, manifest=manifest)
+
+        # 修改2个文件的内容，另外只 touch 2个文件
+        for path in files[:2]:
+            with open(path, 'ab') as f:
+                f.write(b"new data")
+        for path in files[2:4]:
+            os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+
+        print("\n[第3次运行-快速路径] 修改了2个文件，touch了2个文件（size+mtime有变化就重新处理）")
+        _, third_time = file_processor_hybrid(files, io_latency=0.05, manifest=manifest)
+
+        for path in files[4:6]:
+            os.utime(path, ns=(time.time_ns(), time.time_ns() + 2 * 10**9))
+        print("\n[第4次运行-校验模式] touch了2个文件，重新计算全部哈希，内容没变的不重新处理")
+        results, fourth_time = file_processor_hybrid(files, io_latency=0.05, manifest=manifest,
+                                                     verify=True)
+        verified = sum(1 for r in results if r['status'] == 'verified')
+        print(f"  校验通过、复用结果: {verified} 个文件，清单条目: {len(manifest)}")
+
+    print("\n要点:")
+    print("- 快速路径只做一次 stat，未变化的文件不进入进程池")
+    print("- 校验模式重新计算哈希，可以发现 mtime 不可靠时的误判")
+    print("- 清单用 SQLite WAL 模式，多个工作进程可以同时更新")
+
+
+class BatchingChannel:
+    """微批传输通道：包装 mp.Queue，put 时攒批、get 时拆批
+
+    攒够 batch_size 个或第一个元素等待超过 linger 秒就发送一批，
+    整批只付一次 pickle、一次管道写入和一次锁开销。
+    None 仍然是结束信号：put(None) 会先发送已攒的数据，再发送 None。
+    """
+    def __init__(self, maxsize=0, batch_size=64, linger=0.005):
+        self.queue = mp.Queue(maxsize)
+        self.batch_size = batch_size
+        self.linger = linger
+        self._init_local()
+
+    def _init_local(self):
+        # 攒批缓冲区和拆批缓冲区都是每个进程私有的
+        self._out = []
+        self._first_at = 0.0
+        self._in = deque()
+        self._cond = threading.Condition()
+        self._flusher = None
+
+    def __getstate__(self):
+        return {'queue': self.queue, 'batch_size': self.batch_size, 'linger': self.linger}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_local()
+
+    def put(self, item):
+        if item is None:
+            self.flush()
+            self.queue.put(None)
+            return
+        with self._cond:
+            if not self._out:
+                self._first_at = time.monotonic()
+            self._out.append(item)
+            if len(self._out) >= self.batch_size:
+                self._send_locked()
+            elif self.linger > 0:
+                if self._flusher is None:
+                    # 每个写入进程一个后台线程，负责发送超过 linger 的批次
+                    self._flusher = threading.Thread(target=self._linger_loop, daemon=True)
+                    self._flusher.start()
+                self._cond.notify()
+
+    def _linger_loop(self):
+        with self._cond:
+            while True:
+                while not self._out:
+                    self._cond.wait()
+                remaining = self._first_at + self.linger - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                else:
+                    self._send_locked()
+
+    def _send_locked(self):
+        if self._out:
+            batch, self._out = self._out, []
+            self.queue.put(batch)
+
+    def flush(self):
+        """立即发送已攒的数据"""
+        with self._cond:
+            self._send_locked()
+
+    def get(self, timeout=None):
+        if not self._in:
+            batch = self.queue.get(timeout=timeout)
+            if batch is None:
+                return None
+            self._in.extend(batch)
+        return self._in.popleft()
+
+
+def _channel_bench_producer(channel, num_items):
+    for i in range(num_items):
+        channel.put({'id': i, 'value': i * 100})
+    channel.put(None)
+
+
+def batching_channel_benchmark(batch_sizes=(1, 8, 64, 512), num_items=50000):
+    """吞吐对比：普通 mp.Queue vs 不同批大小的 BatchingChannel"""
+    print("\n" + "="*60)
+    print(f"场景5补充: 微批传输 ({num_items} 个元素，生产者进程 → 主进程)")
+    print("="*60)
+
+    channels = [("mp.Queue", lambda: mp.Queue(maxsize=1000))]
+    channels += [(f"批大小 {n}", lambda n=n: BatchingChannel(maxsize=1000, batch_size=n))
+                 for n in batch_sizes]
+    baseline = None
+    for label, make_channel in channels:
+        channel = make_channel()
+        producer = mp.Process(target=_channel_bench_producer, args=(channel, num_items))
+        start = time.perf_counter()
+        producer.start()
+        count = 0
+        while channel.get() is not None:
+            count += 1
+        duration = time.perf_counter() - start
+        producer.join()
+        assert count == num_items
+        rate = count / duration
+        baseline = baseline or rate
+        print(f"  {label:<12} {rate:>10.0f} 条/秒 ({rate/baseline:.1f}x)")
+
+    print("\n要点:")
+    print("- 每次 put 都要 pickle + 写管道 + 加锁，元素越小这部分开销占比越大")
+    print("- 攒批后这些开销由一批元素分摊，吞吐随批大小增长")
+    print("- linger 限制了攒批带来的额外延迟")
+
+
+def bounded_map(executor, fn, iterable, window=64, timeout=None, ordered=True):
+    """Executor.map 的有界窗口版本，适用于 ThreadPoolExecutor 和 ProcessPoolExecutor
+
+    Executor.map 会先把整个输入都提交成 Future，几千万个元素就是几千万个 Future；
+    这里最多只提交 window 个，每取走一个结果再从输入里读一个，内存是 O(window)。
+    - ordered=True 按输入顺序产出，False 按完成顺序产出
+    - timeout 与 Executor.map 一样是从调用开始算的总时限，超时抛出 TimeoutError
+    - 提前停止迭代（break、超时或异常）时取消所有还没开始的任务，包括超时的那一个
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    items = iter(iterable)
+    futures = deque() if ordered else set()
+    add = futures.append if ordered else futures.add
+
+    def remaining():
+        return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+    def submit(count):
+        for item in islice(items, count):
+            add(executor.submit(fn, item))
+
+    try:
+        submit(window)
+        while futures:
+            if ordered:
+                # 先等结果再出队：超时时队头仍在 futures 里，由 finally 一并取消
+                result = futures[0].result(remaining())
+                futures.popleft()
+            else:
+                done, _ = wait(futures, timeout=remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise FutureTimeoutError()
+                future = done.pop()
+                futures.remove(future)
+                result = future.result()
+            submit(1)
+            yield result
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def square(n):
+    return n * n
+
+
+def bounded_map_demo(num_items=50000, window=256):
+    """Executor.map vs bounded_map：首个结果、总耗时、内存峰值"""
+    print("\n" + "="*60)
+    print("场景4补充: 有界窗口的 Executor.map")
+    print("="*60)
+
+    print(f"\n{'执行器':<12}{'方式':<14}{'任务数':>8}{'首个结果':>10}{'总耗时':>9}{'内存峰值':>11}")
+    for executor_cls, count in [(ThreadPoolExecutor, num_items),
+                                (ProcessPoolExecutor, num_items // 10)]:
+        for label in ("Executor.map", "bounded_map"):
+            with executor_cls(max_workers=4) as executor:
+                executor.submit(square, 0).result()  # 先把工作线程/进程启动起来
+                tracemalloc.start()
+                start = time.perf_counter()
+                if label == "Executor.map":
+                    results = executor.map(square, (n for n in range(count)))
+                else:
+                    results = bounded_map(executor, square, (n for n in range(count)), window)
+                first = None
+                total = 0
+                for result in results:
+                    if first is None:
+                        first = time.perf_counter() - start
+                    total += result
+                duration = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            assert total == sum(n * n for n in range(count))
+            print(f"{executor_cls.__name__[:-8]:<14}{label:<16}{count:>8}"
+                  f"{first:>9.3f}s{duration:>8.2f}s{peak/(1024*1024):>9.1f} MB")
+
+    print("\n[超时] 第二个任务要1秒，总时限0.3秒:")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        try:
+            for value in bounded_map(executor, time.sleep, [0.01, 1.0, 0.01], timeout=0.3):
+                print("  完成一个任务")
+        except FutureTimeoutError:
+            print("  抛出 TimeoutError，未开始的任务已取消")
+
+    print("\n要点:")
+    print("- Executor.map 在返回第一个结果前就把全部输入提交成 Future")
+    print("- bounded_map 只保持 window 个任务在途，内存与输入长度无关，可以处理无限生成器")
+    print("- 窗口要足够大，让所有工作线程/进程都有活干")
+
+
 # ===== 场景5: 实时数据处理管道 =====
-def data_pipeline_example():
-    """数据处理管道：生产者-处理者-消费者"""
+class ShmRingBuffer:
+    """基于 multiprocessing.shared_memory 的环形缓冲区通道，可替代传输 bytes 的 mp.Queue
+
+    固定数量、固定大小的槽位；用两个信号量（空槽数 / 数据数）做阻塞和唤醒，
+    数据直接拷贝进共享内存，不经过 pickle、管道和后台 feeder 线程。
+    默认是单生产者/单消费者；multi_producer / multi_consumer 为 True 时加锁支持多个。
+    close() 写入一个关闭标记，所有消费者读到它都会返回 None。
+    """
+    _HEADER = 192              # head、tail 各占一个缓存行
+    _LEN = struct.Struct('I')
+    _INDEX = struct.Struct('Q')
+    _CLOSED = 0xFFFFFFFF
+
+    def __init__(self, capacity=1024, slot_size=4096, multi_producer=False, multi_consumer=False):
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self._stride = self._LEN.size + slot_size
+        self.shm = shared_memory.SharedMemory(create=True,
+                                              size=self._HEADER + capacity * self._stride)
+        self.shm.buf[:self._HEADER] = bytes(self._HEADER)
+        self.items = mp.Semaphore(0)
+        self.spaces = mp.Semaphore(capacity)
+        self.put_lock = mp.Lock() if multi_producer else None
+        self.get_lock = mp.Lock() if multi_consumer else None
+        self._owner = True
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['shm'] = self.shm.name
+        state['_owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=state['shm'])
+
+    def _slot(self, index):
+        return self._HEADER + (index % self.capacity) * self._stride
+
+    def _write(self, data, length):
+        buf = self.shm.buf
+        head = self._INDEX.unpack_from(buf, 0)[0]
+        offset = self._slot(head)
+        self._LEN.pack_into(buf, offset, length)
+        if data is not None:
+            buf[offset + self._LEN.size:offset + self._LEN.size + length] = data
+        self._INDEX.pack_into(buf, 0, head + 1)
+
+    def put(self, data, timeout=None):
+        """写入一条 bytes 类数据（长度不超过 slot_size），没有空槽时阻塞"""
+        data = memoryview(data).cast('B')
+        if len(data) > self.slot_size:
+            raise ValueError(f"数据长度 {len(data)} 超过槽位大小 {self.slot_size}")
+        if not self.spaces.acquire(timeout=timeout):
+            raise queue.Full
+        if self.put_lock is not None:
+            with self.put_lock:
+                self._write(data, len(data))
+        else:
+            self._write(data, len(data))
+        self.items.release()
+
+    def close(self):
+        """写入关闭标记；之后读到它的每个消费者都返回 None"""
+        self.spaces.acquire()
+        if self.put_lock is not None:
+            with self.put_lock:
+                self._write(None, self._CLOSED)
+        else:
+            self._write(None, self._CLOSED)
+        self.items.release()
+
+    def _read(self):
+        buf = self.shm.buf
+        tail = self._INDEX.unpack_from(buf, 64)[0]
+        offset = self._slot(tail)
+        length = self._LEN.unpack_from(buf, offset)[0]
+        if length == self._CLOSED:
+            self.items.release()  # 标记留在原处，让其他消费者也能看到
+            return None
+        start = offset + self._LEN.size
+        data = bytes(buf[start:start + length])
+        self._INDEX.pack_into(buf, 64, tail + 1)
+        self.spaces.release()
+        return data
+
+    def get(self, timeout=None):
+        """读取一条数据；通道关闭后返回 None"""
+        if not self.items.acquire(timeout=timeout):
+            raise queue.Empty
+        if self.get_lock is not None:
+            with self.get_lock:
+                return self._read()
+        return self._read()
+
+    def release(self):
+        """关闭本进程的映射；创建者还会删除共享内存块"""
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+class PipeChannel:
+    """把 Pipe 包装成 put/get 接口，用于对比（空消息表示结束）"""
+    def __init__(self):
+        self.reader, self.writer = mp.Pipe(duplex=False)
+
+    def put(self, data):
+        self.writer.send_bytes(data)
+
+    def close(self):
+        self.writer.send_bytes(b'')
+
+    def get(self):
+        data = self.reader.recv_bytes()
+        return data or None
+
+
+def _finish_channel(channel):
+    """发送结束信号：自定义通道用 close()，mp 的队列用 None"""
+    if isinstance(channel, (ShmRingBuffer, PipeChannel)):
+        channel.close()
+    else:
+        channel.put(None)
+
+
+def _ring_bench_producer(channel, payload, count):
+    for _ in range(count):
+        channel.put(payload)
+    _finish_channel(channel)
+
+
+def _ring_bench_echo(request, response):
+    """延迟测试：收到什么就原样发回去"""
+    while True:
+        data = request.get()
+        if data is None:
+            break
+        response.put(data)
+
+
+def shm_ring_benchmark(count=20000, payload_sizes=(64, 4096), rounds=2000):
+    """共享内存环形缓冲区 vs mp.Queue / mp.SimpleQueue / Pipe"""
+    print("\n" + "="*60)
+    print("场景5补充: 共享内存环形缓冲区通道")
+    print("="*60)
+
+    def make_channels(slot_size):
+        return [
+            ("mp.Queue", mp.Queue),
+            ("mp.SimpleQueue", mp.SimpleQueue),
+            ("Pipe", PipeChannel),
+            ("共享内存环形缓冲区", lambda: ShmRingBuffer(capacity=256, slot_size=slot_size)),
+        ]
+
+    for size in payload_sizes:
+        payload = b'x' * size
+        print(f"\n[吞吐] {count} 条 × {size} 字节，生产者进程 → 主进程")
+        for label, make_channel in make_channels(size):
+            channel = make_channel()
+            producer = mp.Process(target=_ring_bench_producer, args=(channel, payload, count))
+            start = time.perf_counter()
+            producer.start()
+            received = 0
+            while channel.get() is not None:
+                received += 1
+            duration = time.perf_counter() - start
+            producer.join()
+            assert received == count
+            if isinstance(channel, ShmRingBuffer):
+                channel.release()
+            print(f"  {label:<12} {count/duration:>10.0f} 条/秒  "
+                  f"{count*size/duration/(1024*1024):>8.1f} MB/s")
+
+    print(f"\n[延迟] 64 字节往返 {rounds} 次（主进程 → 回显进程 → 主进程）")
+    for label, make_channel in make_channels(64):
+        request, response = make_channel(), make_channel()
+        echo = mp.Process(target=_ring_bench_echo, args=(request, response))
+        echo.start()
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            request.put(b'p' * 64)
+            response.get()
+            samples.append(time.perf_counter() - start)
+        _finish_channel(request)
+        echo.join()
+        for channel in (request, response):
+            if isinstance(channel, ShmRingBuffer):
+                channel.release()
+        samples.sort()
+        print(f"  {label:<12} 中位数 {samples[len(samples)//2]*1e6:>7.1f} 微秒  "
+              f"p99 {samples[int(len(samples)*0.99)]*1e6:>7.1f} 微秒")
+
+    print("\n要点:")
+    print("- mp.Queue 每条消息都要 pickle，并经过后台 feeder 线程写入管道")
+    print("- 环形缓冲区直接拷贝 bytes 到共享内存，只用信号量唤醒对方")
+    print("- 槽位大小固定，适合长度有上限的 bytes 消息；需要多生产者/多消费者时打开对应的锁")
+
+
+class StageTelemetry:
+    """管道单个阶段的统计：进出数量、等待输入/等待输出时间、忙碌时间
+
+    阶段通过 get()/put() 访问队列，等待时间自动计入；结束时 report() 把结果发回主进程。
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.wait_in = 0.0   # 等上游（饥饿）
+        self.wait_out = 0.0  # 等下游（背压）
+        self.started = time.perf_counter()
+
+    def get(self, queue):
+        start = time.perf_counter()
+        item = queue.get()
+        self.wait_in += time.perf_counter() - start
+        if item is not None:
+            self.items_in += 1
+        return item
+
+    def put(self, queue, item):
+        start = time.perf_counter()
+        queue.put(item)
+        self.wait_out += time.perf_counter() - start
+        if item is not None:
+            self.items_out += 1
+
+    def report(self, telemetry_queue):
+        elapsed = time.perf_counter() - self.started
+        telemetry_queue.put({
+            'name': self.name,
+            'items_in': self.items_in,
+            'items_out': self.items_out,
+            'wait_in': self.wait_in,
+            'wait_out': self.wait_out,
+            'busy': max(elapsed - self.wait_in - self.wait_out, 0.0),
+            'elapsed': elapsed,
+        })
+
+
+def _queue_size(channel):
+    """尽量取得通道里的元素数（批量通道按批计），不支持时返回None"""
+    target = getattr(channel, 'in_queue', None) or getattr(channel, 'queue', None) or channel
+    try:
+        return target.qsize()
+    except (NotImplementedError, AttributeError):
+        return None  # macOS 上的 mp.Queue 不支持 qsize
+
+
+class QueueDepthSampler:
+    """后台线程定期采样各个队列的深度"""
+    def __init__(self, queues, interval=0.05):
+        self.queues = queues  # {名称: 队列}
+        self.interval = interval
+        self.samples = {name: [] for name in queues}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for name, q in self.queues.items():
+                size = _queue_size(q)
+                if size is not None:
+                    self.samples[name].append(size)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def print_pipeline_report(stats, sampler=None, min_elapsed=0.01):
+    """打印每个阶段的利用率，并指出瓶颈阶段
+
+    没有处理任何元素、或运行时间短于 min_elapsed 的阶段，利用率没有意义，不参与瓶颈判断。
+    """
+    print("\n管道统计:")
+    print(f"  {'阶段':<10}{'输入':>6}{'输出':>6}{'忙碌':>9}{'等输入':>9}{'等输出':>9}{'利用率':>8}")
+    for s in stats:
+        measurable = (s['items_in'] or s['items_out']) and s['elapsed'] >= min_elapsed
+        s['utilization'] = s['busy'] / s['elapsed'] if measurable else None
+        utilization = f"{s['utilization']:>9.0%}" if measurable else f"{'-':>9}"
+        print(f"  {s['name']:<10}{s['items_in']:>7}{s['items_out']:>7}"
+              f"{s['busy']:>9.2f}s{s['wait_in']:>8.2f}s{s['wait_out']:>8.2f}s{utilization}")
+    if sampler is not None:
+        for name, samples in sampler.samples.items():
+            if samples:
+                print(f"  队列 {name}: 平均深度 {sum(samples)/len(samples):.1f}, "
+                      f"最大 {max(samples)} ({len(samples)} 次采样)")
+    measured = [s for s in stats if s['utilization'] is not None]
+    if measured:
+        bottleneck = max(measured, key=lambda s: s['utilization'])
+        print(f"  瓶颈: {bottleneck['name']} (利用率 {bottleneck['utilization']:.0%})"
+              f"，扩展这个阶段收益最大")
+    elif stats:
+        print("  没有处理任何数据，无法判断瓶颈")
+    return stats
+
+
+def transform_record(data):
+    """管道的处理阶段（CPU密集）"""
+    return {
+        'id': data['id'],
+        'result': sum(i for i in range(data['value']))
+    }
+
+
+class PipelineError(Exception):
+    """管道中某个阶段处理元素时出错"""
+
+
+class _StageFailure:
+    """并行阶段的副本处理元素出错时发给下游的标记，get() 收到后抛出 PipelineError"""
+    def __init__(self, name, seq, tb):
+        self.name = name
+        self.seq = seq
+        self.tb = tb
+
+
+def _parallel_stage_worker(func, in_queue, out_queue, telemetry_queue=None, name="stage"):
+    """并行阶段的一个副本：处理 (序号, 数据)，收到 None 或出错时转发 None 后退出"""
+    telemetry = StageTelemetry(name)
+    try:
+        while True:
+            msg = telemetry.get(in_queue)
+            if msg is None:
+                break
+            seq, item = msg
+            try:
+                result = func(item)
+            except Exception:
+                out_queue.put(_StageFailure(name, seq, traceback.format_exc()))
+                break
+            telemetry.put(out_queue, (seq, result))
+    finally:
+        # 出错时也必须转发结束信号，否则下游一直等不齐 N 个 None
+        out_queue.put(None)
+        if telemetry_queue is not None:
+            telemetry.report(telemetry_queue)
+
+
+class ParallelStage:
+    """用 N 个工作进程并行执行一个管道阶段
+
+    上游调用 put()，下游调用 get()，用法和队列一样：put(None) 结束，get() 返回 None 表示结束。
+    某个副本处理元素出错时，get() 抛出 PipelineError，不会等待永远不会到达的序号。
+    ordered=True 时元素带上序号，下游按原顺序重组；window 限制同时在途的元素数，
+    因此重组缓冲区最多 window 个元素。ordered=False 时按完成顺序输出。
+    """
+    def __init__(self, func, workers=4, ordered=True, window=64, maxsize=0,
+                 telemetry_queue=None, name="stage"):
+        self.func = func
+        self.workers = workers
+        self.telemetry_queue = telemetry_queue
+        self.name = name
+        self.ordered = ordered
+        self.in_queue = mp.Queue(maxsize)
+        self.out_queue = mp.Queue(maxsize)
+        self.window = mp.Semaphore(window) if ordered else None
+        self.processes = []
+        # 上游状态（put 所在的进程）
+        self._seq = 0
+        # 下游状态（get 所在的进程）
+        self._buffer = {}
+        self._next = 0
+        self._finished = 0
+        self.max_buffered = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['processes'] = []
+        return state
+
+    def start(self):
+        for i in range(self.workers):
+            p = mp.Process(target=_parallel_stage_worker,
+                           args=(self.func, self.in_queue, self.out_queue,
+                                 self.telemetry_queue, f"{self.name}-{i}"),
+                           name=f"{self.name}-{i}")
+            p.start()
+            self.processes.append(p)
+
+    def put(self, item):
+        if item is None:
+            # 每个副本都需要一个结束信号
+            for _ in range(self.workers):
+                self.in_queue.put(None)
+            return
+        if self.window is not None:
+            self.window.acquire()  # 在途元素达到 window 时等待下游消费
+        self.in_queue.put((self._seq, item))
+        self._seq += 1
+
+    def get(self):
+        while True:
+            if self.ordered and self._next in self._buffer:
+                item = self._buffer.pop(self._next)
+                self._next += 1
+                self.window.release()
+                return item
+            if self._finished == self.workers:
+                return None
+            msg = self.out_queue.get()
+            if msg is None:
+                self._finished += 1  # 所有副本都结束后才算结束
+                continue
+            if isinstance(msg, _StageFailure):
+                raise PipelineError(f"阶段 {msg.name!r} 处理第 {msg.seq} 个元素时出错:\n{msg.tb}")
+            seq, result = msg
+            if not self.ordered:
+                return result
+            self._buffer[seq] = result
+            self.max_buffered = max(self.max_buffered, len(self._buffer))
+
+    def join(self):
+        for p in self.processes:
+            p.join()
+
+
+def _fan_out_producer(stage, num_items, value):
+    for i in range(num_items):
+        stage.put({'id': i, 'value': value})
+    stage.put(None)
+
+
+def parallel_stage_demo(num_items=100, value=200000, worker_counts=(1, 4)):
+    """处理阶段扩展为多个进程：保序 vs 不保序"""
+    print("\n" + "="*60)
+    print(f"场景5补充: 并行处理阶段 ({num_items} 条数据)")
+    print("="*60)
+
+    for workers in worker_counts:
+        for ordered in (True, False):
+            stage = ParallelStage(transform_record, workers=workers, ordered=ordered, window=32)
+            stage.start()
+            producer = mp.Process(target=_fan_out_producer, args=(stage, num_items, value))
+            start = time.time()
+            producer.start()
+            ids = []
+            while True:
+                result = stage.get()
+                if result is None:
+                    break
+                ids.append(result['id'])
+            duration = time.time() - start
+            producer.join()
+            stage.join()
+            in_order = ids == sorted(ids)
+            mode = "保序" if ordered else "不保序"
+            extra = f", 重组缓冲区峰值 {stage.max_buffered}" if ordered else ""
+            print(f"  {workers}个进程-{mode}: {duration:.2f} 秒, 收到 {len(ids)} 条, "
+                  f"{'按原顺序' if in_order else '顺序被打乱'}{extra}")
+
+    print("\n要点:")
+    print("- 单进程的处理阶段是整个管道的瓶颈，扩展成N个进程后吞吐接近N倍（取决于CPU核数）")
+    print("- 保序模式用序号重组，window 限制在途元素数，重组缓冲区不会无限增长")
+    print("- 不关心顺序时用不保序模式，没有队头阻塞")
+    print("- 每个副本各自转发结束信号，下游收齐N个后才结束")
+
+
+class _EndOfStream:
+    """管道的结束信号；None 是合法的阶段结果，所以用专门的类型，经过 pickle 后用 isinstance 判断"""
+
+
+class PipelineStage:
+    """管道阶段声明：名称、处理函数、执行方式、并行度、输入队列上限"""
+    KINDS = ('process', 'thread', 'async')
+
+    def __init__(self, name, func, kind='thread', workers=1, maxsize=16):
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的阶段类型 {kind!r}，可选: {', '.join(self.KINDS)}")
+        self.name = name
+        self.func = func
+        self.kind = kind
+        self.workers = workers
+        self.maxsize = maxsize
+
+
+class _ProcessChannel:
+    """进程间通道：put 在调用线程里把数据写完才返回，容量用信号量限制，等同 mp.Queue(maxsize)
+
+    mp.Queue 的 put 交给后台线程发送；进程副本在 func 里崩溃（os._exit、被杀死）时，
+    后台线程可能正拿着队列的写锁，之后任何进程都写不进去，结束信号也发不出。
+    这里崩溃只会发生在两次 put 之间，不会留下被占用的锁；结果无法 pickle 时 put 直接抛异常。
+    """
+    def __init__(self, maxsize=0):
+        self.queue = mp.SimpleQueue()
+        self.slots = mp.BoundedSemaphore(maxsize) if maxsize > 0 else None
+
+    def put(self, item):
+        if self.slots is not None:
+            self.slots.acquire()
+        try:
+            self.queue.put(item)
+        except BaseException:
+            if self.slots is not None:
+                self.slots.release()
+            raise
+
+    def get(self):
+        item = self.queue.get()
+        if self.slots is not None:
+            self.slots.release()
+        return item
+
+
+def _pipeline_worker(name, func, in_queue, out_queue, abort, errors):
+    """线程/进程阶段的工作循环；出错后只排空输入，保证上下游都能正常结束"""
+    while True:
+        item = in_queue.get()
+        if isinstance(item, _EndOfStream):
+            break
+        if abort.is_set():
+            continue
+        try:
+            out_queue.put(func(item))  # put 也在 try 里：进程间传不了的结果同样算出错
+        except Exception:
+            errors.put((name, repr(item), traceback.format_exc()))
+            abort.set()
+
+
+async def _async_pipeline_worker(name, func, get, put, abort, errors):
+    """协程阶段的工作循环"""
+    while True:
+        item = await get()
+        if isinstance(item, _EndOfStream):
+            break
+        if abort.is_set():
+            continue
+        try:
+            result = await func(item)
+        except Exception:
+            errors.put((name, repr(item), traceback.format_exc()))
+            abort.set()
+            continue
+        await put(result)
+
+
+class Pipeline:
+    """声明式管道：每个阶段声明自己是进程、线程还是协程，框架负责连接和收尾
+
+        pipeline = (Pipeline()
+                    .add("下载", fetch, kind='async', workers=50)
+                    .add("解析", parse, kind='process', workers=4)
+                    .add("入库", store, kind='thread', workers=8))
+        results = pipeline.run(urls)
+
+    阶段之间的通道按两端的类型选择：
+    - 任一端是进程 → _ProcessChannel（同步写入的 mp.SimpleQueue）
+    - 两端都是协程 → asyncio.Queue（所有协程阶段共用一个事件循环线程）
+    - 其他 → queue.Queue；协程端通过专用线程池桥接阻塞的 get/put
+    每个阶段的全部副本结束后，再向下游发送与下游副本数相同的结束信号。
+    任一元素处理失败（包括数据源和 sink 出错）或进程副本异常退出时，其余阶段停止处理、
+    排空队列，结束信号照常传递，run() 抛出 PipelineError。
+    """
+    def __init__(self):
+        self.stages = []
+
+    def add(self, name, func, kind='thread', workers=1, maxsize=16):
+        self.stages.append(PipelineStage(name, func, kind, workers, maxsize))
+        return self
+
+    def _make_channel(self, up_kind, down_kind, maxsize):
+        if 'process' in (up_kind, down_kind):
+            return _ProcessChannel(maxsize)
+        if up_kind == down_kind == 'async':
+            return None  # 在事件循环里创建 asyncio.Queue
+        return queue.Queue(maxsize)
+
+    def run(self, source, sink=None):
+        """运行管道；sink 为 None 时返回所有结果的列表"""
+        stages = self.stages
+        # 通道 i 连接"第 i 个节点"和"第 i+1 个节点"，节点 0 是数据源，最后一个是结果汇总
+        kinds = ['thread'] + [s.kind for s in stages] + ['thread']
+        downstream_workers = [s.workers for s in stages] + [1]
+        channels = [self._make_channel(kinds[i], kinds[i + 1],
+                                       stages[i].maxsize if i < len(stages) else 0)
+                    for i in range(len(stages) + 1)]
+        abort = mp.Event()
+        errors = mp.Queue()
+        supervisors = []
+
+        def supervise(stage, workers, in_channel, out_channel, sentinels):
+            crashed = 0
+            for w in workers:
+                w.join()
+                code = getattr(w, 'exitcode', 0)  # 线程没有 exitcode
+                if code:
+                    # 进程副本异常退出（如被杀死、os._exit），它手上的元素已经丢失
+                    errors.put((stage.name, "-", f"worker exited with code {code}"))
+                    abort.set()
+                    crashed += 1
+            # 异常退出的副本没有取走自己的结束信号，替它排空输入，上游才不会卡在 put 上
+            while crashed:
+                if isinstance(in_channel.get(), _EndOfStream):
+                    crashed -= 1
+            for _ in range(sentinels):
+                out_channel.put(_EndOfStream())
+
+        for i, stage in enumerate(stages):
+            if stage.kind == 'async':
+                continue
+            worker_cls = mp.Process if stage.kind == 'process' else threading.Thread
+            workers = [worker_cls(target=_pipeline_worker,
+                                  args=(stage.name, stage.func, channels[i], channels[i + 1],
+                                        abort, errors),
+                                  name=f"{stage.name}-{n}", daemon=True)
+                       for n in range(stage.workers)]
+            for w in workers:
+                w.start()
+            supervisors.append(threading.Thread(
+                target=supervise,
+                args=(stage, workers, channels[i], channels[i + 1], downstream_workers[i + 1])))
+
+        async_indexes = [i for i, s in enumerate(stages) if s.kind == 'async']
+        if async_indexes:
+            bridge = ThreadPoolExecutor(
+                max_workers=2 * sum(stages[i].workers for i in async_indexes) + 2,
+                thread_name_prefix="async-bridge")
+
+            async def run_async_stages():
+                loop = asyncio.get_running_loop()
+                local = {i: asyncio.Queue(stages[i].maxsize if i < len(stages) else 0)
+                         for i, c in enumerate(channels) if c is None}
+
+                def adapters(index):
+                    if index in local:
+                        return local[index].get, local[index].put
+                    channel = channels[index]
+                    return (lambda: loop.run_in_executor(bridge, channel.get),
+                            lambda item: loop.run_in_executor(bridge, channel.put, item))
+
+                async def supervise_async(i, stage):
+                    get, _ = adapters(i)
+                    _, put = adapters(i + 1)
+                    await asyncio.gather(*[
+                        _async_pipeline_worker(stage.name, stage.func, get, put, abort, errors)
+                        for _ in range(stage.workers)])
+                    for _ in range(downstream_workers[i + 1]):
+                        await put(_EndOfStream())
+
+                await asyncio.gather(*[supervise_async(i, stages[i]) for i in async_indexes])
+
+            supervisors.append(threading.Thread(target=asyncio.run, args=(run_async_stages(),),
+                                                name="async-stages"))
+
+        def feed():
+            try:
+                for item in source:
+                    if abort.is_set():
+                        break  # 已经出错，不再读取数据源
+                    channels[0].put(item)
+            except Exception:
+                errors.put(("数据源", "-", traceback.format_exc()))
+                abort.set()
+            finally:
+                for _ in range(downstream_workers[0]):
+                    channels[0].put(_EndOfStream())
+
+        supervisors.append(threading.Thread(target=feed, name="source"))
+        for t in supervisors:
+            t.start()
+
+        results = []
+        while True:
+            result = channels[-1].get()
+            if isinstance(result, _EndOfStream):
+                break
+            if abort.is_set():
+                continue  # 已经出错，只排空队列，让上游都能结束
+            if sink is None:
+                results.append(result)
+                continue
+            try:
+                sink(result)
+            except Exception:
+                errors.put(("结果处理", repr(result), traceback.format_exc()))
+                abort.set()
+
+        for t in supervisors:
+            t.join()
+        if async_indexes:
+            bridge.shutdown()
+
+        if abort.is_set():
+            name, item, tb = errors.get()
+            raise PipelineError(f"阶段 {name!r} 处理 {item} 时出错:\n{tb}")
+        return results if sink is None else None
+
+
+async def _builder_fetch(item_id):
+    """协程阶段：模拟网络请求"""
+    await asyncio.sleep(0.05)
+    return {'id': item_id, 'value': 20000 + item_id}
+
+
+def _builder_store(record):
+    """线程阶段：模拟写数据库"""
+    time.sleep(0.01)
+    return record['id']
+
+
+def _builder_fail_on_13(record):
+    if record['id'] == 13:
+        raise ValueError("第13条数据格式错误")
+    return record
+
+
+def pipeline_builder_demo(num_items=100):
+    """协程下载 → 进程计算 → 线程入库 的混合管道"""
+    print("\n" + "="*60)
+    print(f"场景5补充: 声明式混合管道 ({num_items} 条数据)")
+    print("="*60)
+
+    pipeline = (Pipeline()
+                .add("下载", _builder_fetch, kind='async', workers=20)
+                .add("计算", transform_record, kind='process', workers=2)
+                .add("入库", _builder_store, kind='thread', workers=4))
+
+    start = time.time()
+    ids = pipeline.run(range(num_items))
+    duration = time.time() - start
+    print(f"\n[协程×20 → 进程×2 → 线程×4] 完成 {len(ids)} 条，耗时 {duration:.2f} 秒")
+    print(f"  串行预计: {num_items * 0.06:.2f} 秒以上（每条下载50ms + 入库10ms + 计算）")
+
+    print("\n[错误处理] 校验阶段第13条数据出错:")
+    failing = (Pipeline()
+               .add("下载", _builder_fetch, kind='async', workers=20)
+               .add("校验", _builder_fail_on_13, kind='process', workers=2)
+               .add("入库", _builder_store, kind='thread', workers=4))
+    try:
+        failing.run(range(num_items))
+    except PipelineError as e:
+        print(f"  捕获到 PipelineError: {str(e).splitlines()[0]}")
+        print("  所有阶段都已正常退出，没有遗留的进程或线程")
+
+    print("\n要点:")
+    print("- 高并发I/O用协程，CPU计算用进程，阻塞I/O用线程，在一条管道里组合")
+    print("- 框架根据相邻阶段的类型选择进程间通道 / queue.Queue / asyncio.Queue")
+    print("- 结束信号和错误都会沿管道传播，不会卡死")
+
+
+def transform_scalar(data):
+    """逐条版本的计算：sum(range(v)) 的闭式 v*(v-1)//2，与 transform_columns 算法相同"""
+    value = data['value']
+    return {'id': data['id'], 'result': value * (value - 1) // 2}
+
+
+def transform_columns(values):
+    """transform_scalar 的向量化版本，一次处理整批"""
+    return values * (values - 1) // 2
+
+
+class ColumnBatcher:
+    """把逐条的字典记录累积进预先分配的 NumPy 列，攒满 batch_size 条后整批交给 flush
+
+    每个字段占一行，flush 收到形状为 (字段数, 条数) 的连续数组；结束时调用 close() 发出不满的最后一批。
+    """
+    def __init__(self, fields, batch_size, flush, dtype='int64'):
+        self.fields = fields
+        self.batch_size = batch_size
+        self._flush = flush
+        self.columns = np.empty((len(fields), batch_size), dtype=dtype)
+        self.count = 0
+
+    def append(self, record):
+        for row, field in enumerate(self.fields):
+            self.columns[row, self.count] = record[field]
+        self.count += 1
+        if self.count == self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.count:
+            self._flush(np.ascontiguousarray(self.columns[:, :self.count]))
+            self.count = 0
+
+    def close(self):
+        self.flush()
+
+
+def _columnar_producer(conn, num_items, batch_size):
+    """生成和逐条路径相同的字典记录，累积成 id / value 两列，整批以原始字节发送"""
+    batcher = ColumnBatcher(('id', 'value'), batch_size, conn.send_bytes)
+    for i in range(num_items):
+        batcher.append({'id': i, 'value': i % 1000})
+    batcher.close()
+    conn.send_bytes(b'')  # 空消息表示结束
+    conn.close()
+
+
+def _columnar_processor(in_conn, out_conn):
+    while True:
+        data = in_conn.recv_bytes()
+        if not data:
+            out_conn.send_bytes(b'')
+            break
+        ids, values = np.frombuffer(data, dtype=np.int64).reshape(2, -1)
+        out_conn.send_bytes(np.stack([ids, transform_columns(values)]))
+    out_conn.close()
+
+
+def _dict_producer(queue, num_items):
+    for i in range(num_items):
+        queue.put({'id': i, 'value': i % 1000})
+    queue.put(None)
+
+
+def _dict_processor(in_queue, out_queue):
+    while True:
+        data = in_queue.get()
+        if data is None:
+            out_queue.put(None)
+            break
+        out_queue.put(transform_scalar(data))
+
+
+def numpy_batch_benchmark(num_items=20000, batch_size=4096):
+    """逐条字典 vs NumPy 列式批处理"""
+    print("\n" + "="*60)
+    print(f"场景5补充: NumPy 列式批处理 ({num_items} 条数据)")
+    print("="*60)
+    if np is None:
+        print("未安装 numpy，跳过（pip install numpy）")
+        return
+
+    # 逐条字典：生产者 → 处理者 → 主进程
+    raw_queue, processed_queue = mp.Queue(1000), mp.Queue(1000)
+    procs = [mp.Process(target=_dict_producer, args=(raw_queue, num_items)),
+             mp.Process(target=_dict_processor, args=(raw_queue, processed_queue))]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    dict_total = 0
+    while True:
+        item = processed_queue.get()
+        if item is None:
+            break
+        dict_total += item['result']
+    dict_time = time.perf_counter() - start
+    for p in procs:
+        p.join()
+    print(f"\n[逐条字典]   {dict_time:.2f} 秒, {num_items/dict_time:>10.0f} 条/秒")
+
+    # 列式批处理：数组原始字节经 Pipe 传输，处理者整批向量化计算
+    raw_recv, raw_send = mp.Pipe(duplex=False)
+    out_recv, out_send = mp.Pipe(duplex=False)
+    procs = [mp.Process(target=_columnar_producer, args=(raw_send, num_items, batch_size)),
+             mp.Process(target=_columnar_processor, args=(raw_recv, out_send))]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    raw_send.close()
+    out_send.close()
+    column_total = 0
+    while True:
+        data = out_recv.recv_bytes()
+        if not data:
+            break
+        ids, results = np.frombuffer(data, dtype=np.int64).reshape(2, -1)
+        column_total += int(results.sum())
+    column_time = time.perf_counter() - start
+    for p in procs:
+        p.join()
+    print(f"[列式批处理] {column_time:.2f} 秒, {num_items/column_time:>10.0f} 条/秒 "
+          f"(批大小 {batch_size}, 加速 {dict_time/column_time:.1f}x)")
+    assert dict_total == column_total
+
+    print("\n要点:")
+    print("- 逐条字典：每条都要 pickle、过队列，再在Python循环里计算")
+    print("- 列式批处理：逐条记录先累积进 NumPy 列，整批以原始字节传输，计算在NumPy的C循环里完成")
+    print("- 两条路径用同一个公式计算，加速只来自批量传输和向量化")
+    print("- 适合字段固定、以数值计算为主的记录")
+
+
+def data_pipeline_example(batch_size=1, linger=0.02, processor_workers=1, ordered=True,
+                          journal_path=None):
+    """数据处理管道：生产者-处理者-消费者
+
+    batch_size > 1 时阶段之间使用 BatchingChannel 微批传输；
+    processor_workers > 1 时处理阶段由 ParallelStage 的多个进程并行执行。
+    ParallelStage 自带队列，不支持微批，两者不能同时使用。
+    每个阶段结束时上报统计，最后打印各阶段利用率和瓶颈。
+    传入 journal_path 时消费者记录已存储的数据，重新运行时生产者跳过这些数据。
+    """
+    if processor_workers > 1 and batch_size > 1:
+        raise ValueError("processor_workers > 1 时不支持 batch_size > 1")
+
     print("\n" + "="*60)
     print("场景5: 实时数据处理管道")
     print("="*60)
     
-    # 使用队列连接各个阶段
-    raw_queue = mp.Queue(maxsize=10)
-    processed_queue = mp.Queue(maxsize=10)
+    telemetry_queue = mp.Queue()
     
     def producer(queue):
         """生产原始数据"""
         print("[生产者] 开始生产数据...")
+        telemetry = StageTelemetry("生产者")
+        done = CheckpointJournal.read(journal_path) if journal_path else {}
         for i in range(20):
+            if i in done:
+                continue  # 上次已经处理并存储
             data = {'id': i, 'value': i * 100}
-            queue.put(data)
+            telemetry.put(queue, data)
             time.sleep(0.1)
         queue.put(None)  # 结束信号
+        telemetry.report(telemetry_queue)
         print("[生产者] 完成")
     
     def processor(in_queue, out_queue):
         """处理数据（CPU密集）"""
         print("[处理者] 开始处理数据...")
-        count = 0
+        telemetry = StageTelemetry("处理者")
         while True:
-            data = in_queue.get()
+            data = telemetry.get(in_queue)
             if data is None:
                 out_queue.put(None)
                 break
             
             # 模拟CPU密集处理
-            processed = {
-                'id': data['id'],
-                'result': sum(i for i in range(data['value']))
-            }
-            out_queue.put(processed)
-            count += 1
+            processed = transform_record(data)
+            telemetry.put(out_queue, processed)
         
-        print(f"[处理者] 完成，处理了 {count} 条数据")
+        telemetry.report(telemetry_queue)
+        print(f"[处理者] 完成，处理了 {telemetry.items_out} 条数据")
     
     def consumer(queue):
         """消费处理后的数据"""
         print("[消费者] 开始消费数据...")
-        count = 0
+        telemetry = StageTelemetry("消费者")
+        journal = CheckpointJournal(journal_path) if journal_path else None
         while True:
-            data = queue.get()
+            data = telemetry.get(queue)
             if data is None:
                 break
             # 模拟存储
             time.sleep(0.05)
-            count += 1
+            if journal is not None:
+                journal.mark_done(data['id'])
         
-        print(f"[消费者] 完成，消费了 {count} 条数据")
+        if journal is not None:
+            journal.close()
+        telemetry.report(telemetry_queue)
+        print(f"[消费者] 完成，消费了 {telemetry.items_in} 条数据")
     
     # 创建进程
-    prod = mp.Process(target=producer, args=(raw_queue,))
-    proc = mp.Process(target=processor, args=(raw_queue, processed_queue))
-    cons = mp.Process(target=consumer, args=(processed_queue,))
+    if processor_workers > 1:
+        # 处理阶段由多个进程并行执行，生产者和消费者直接与 ParallelStage 交互
+        stage = ParallelStage(transform_record, workers=processor_workers, ordered=ordered,
+                              telemetry_queue=telemetry_queue, name="处理者")
+        prod = mp.Process(target=producer, args=(stage,))
+        cons = mp.Process(target=consumer, args=(stage,))
+        stages = [prod, cons]
+        queues = {'处理者输入': stage.in_queue, '处理者输出': stage.out_queue}
+    else:
+        stage = None
+        # 使用队列连接各个阶段
+        if batch_size > 1:
+            raw_queue = BatchingChannel(maxsize=10, batch_size=batch_size, linger=linger)
+            processed_queue = BatchingChannel(maxsize=10, batch_size=batch_size, linger=linger)
+        else:
+            raw_queue = mp.Queue(maxsize=10)
+            processed_queue = mp.Queue(maxsize=10)
+        prod = mp.Process(target=producer, args=(raw_queue,))
+        proc = mp.Process(target=processor, args=(raw_queue, processed_queue))
+        cons = mp.Process(target=consumer, args=(processed_queue,))
+        stages = [prod, proc, cons]
+        queues = {'raw': raw_queue, 'processed': processed_queue}
     
     print("\n启动管道...")
     start = time.time()
     
-    prod.start()
-    proc.start()
-    cons.start()
-    
-    prod.join()
-    proc.join()
-    cons.join()
+    with QueueDepthSampler(queues) as sampler:
+        if stage is not None:
+            stage.start()
+        for p in stages:
+            p.start()
+        
+        # 先收统计再 join，避免子进程因队列未读完而无法退出
+        reporters = len(stages) + (processor_workers if stage is not None else 0)
+        stats = [telemetry_queue.get() for _ in range(reporters)]
+        
+        for p in stages:
+            p.join()
+        if stage is not None:
+            stage.join()
     
     duration = time.time() - start
     
     print(f"\n管道完成！总耗时: {duration:.2f} 秒")
+    print_pipeline_report(stats, sampler)
     print("\n架构:")
-    print("生产者(进程) → 队列 → 处理者(进程) → 队列 → 消费者(进程)")
+    if stage is not None:
+        print(f"生产者(进程) → 队列 → 处理者({processor_workers}个进程) → 重组 → 消费者(进程)")
+    elif batch_size > 1:
+        print(f"生产者(进程) → 微批通道(每批{batch_size}条) → 处理者(进程) → 微批通道 → 消费者(进程)")
+    else:
+        print("生产者(进程) → 队列 → 处理者(进程) → 队列 → 消费者(进程)")
     print("优点: 各阶段独立，可以充分利用多核，解耦合")
 
 
+# ===== 场景6: 长任务的检查点与断点续跑 =====
+class CheckpointJournal:
+    """追加写的检查点日志：每完成一个任务追加一行 {"id": 任务ID, "result": 结果}
+
+    每 sync_every 条或每隔 sync_interval 秒才 fsync 一次，把落盘开销分摊到一批记录上；
+    崩溃时最多丢失最后一批，这些任务在续跑时会重新执行。
+    """
+    def __init__(self, path, sync_every=256, sync_interval=1.0):
+        self.path = str(path)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.done = self.read(self.path, repair=True)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.syncs = 0
+
+    @staticmethod
+    def read(path, repair=False):
+        """读取已完成的任务 {任务ID: 结果}；repair=True 时截掉崩溃留下的半行"""
+        done = {}
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return done
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            done[record['id']] = record.get('result')
+        if repair and len(complete) != len(data):
+            with open(path, 'r+b') as f:
+                f.truncate(len(complete))
+        return done
+
+    def completed(self):
+        with self.lock:
+            return dict(self.done)
+
+    def mark_done(self, task_id, result=None):
+        line = json.dumps({'id': task_id, 'result': result}) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.done[task_id] = result
+            self.pending += 1
+            if (self.pending >= self.sync_every
+                    or time.monotonic() - self.last_sync >= self.sync_interval):
+                self._sync_locked()
+
+    def _sync_locked(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.syncs += 1
+
+    def sync(self):
+        with self.lock:
+            self._sync_locked()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self._sync_locked()
+                self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def checkpoint_resume_demo():
+    """演示检查点开销和断点续跑"""
+    print("\n" + "="*60)
+    print("场景6: 长任务的检查点与断点续跑")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # 检查点开销：每条 fsync vs 批量 fsync
+        print("\n[检查点开销] 记录 2000 个完成的任务:")
+        for sync_every in (1, 256):
+            path = os.path.join(workdir, f"overhead_{sync_every}.jsonl")
+            start = time.perf_counter()
+            with CheckpointJournal(path, sync_every=sync_every) as journal:
+                for i in range(2000):
+                    journal.mark_done(i, {'checksum': i % 1000})
+            duration = time.perf_counter() - start
+            print(f"  每 {sync_every:>3} 条 fsync 一次: {duration*1000:8.1f}ms, "
+                  f"每条 {duration/2000*1e6:7.1f} 微秒, fsync {journal.syncs} 次")
+
+        # 断点续跑：第一次只跑完前5张就"崩溃"，第二次从检查点继续
+        image_ids = list(range(1, 9))
+        path = os.path.join(workdir, "images.jsonl")
+        print("\n[图像处理] 第一次运行在处理完5张后中断")
+        with CheckpointJournal(path) as journal:
+            image_processor_process(image_ids[:5], journal)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('{"id": 6, "res')  # 模拟崩溃时写了一半的记录
+        print("\n[图像处理] 重新运行全部8张")
+        with CheckpointJournal(path) as journal:
+            results, duration = image_processor_process(image_ids, journal)
+        print(f"  结果完整: {[r['image_id'] for r in results] == image_ids}")
+
+        # 管道：第一次运行完整跑完，第二次运行全部跳过
+        path = os.path.join(workdir, "pipeline.jsonl")
+        print("\n[数据管道] 第一次运行")
+        data_pipeline_example(journal_path=path)
+        print("\n[数据管道] 第二次运行（全部已完成）")
+        data_pipeline_example(journal_path=path)
+
+    print("\n要点:")
+    print("- 检查点是追加写的日志，写一行的开销很小")
+    print("- fsync 才是昂贵的部分，批量 fsync 把它分摊到很多条记录上")
+    print("- 续跑时跳过已完成的任务，崩溃时写了一半的记录会被丢弃")
+
+
 # ===== 主函数 =====
 def main():
     print("="*60)
@@ -424,15 +3150,33 @@ def main():
     
     # 场景2: 图像处理
     compare_image_processing()
+    cached_image_processing_demo()
     
     # 场景3: 数据库操作
     compare_database_operations()
+    connection_pool_demo()
+    compare_database_models()
+    sharding_contention_benchmark()
+    group_commit_demo()
+    mixed_read_write_benchmark()
     
     # 场景4: 文件处理
     compare_file_processing()
+    streaming_walker_demo()
+    incremental_processing_demo()
+    bounded_map_demo()
     
     # 场景5: 数据管道
     data_pipeline_example()
+    data_pipeline_example(batch_size=5)
+    batching_channel_benchmark()
+    parallel_stage_demo()
+    shm_ring_benchmark()
+    pipeline_builder_demo()
+    numpy_batch_benchmark()
+    
+    # 场景6: 检查点与断点续跑
+    checkpoint_resume_demo()
     
     # 总结
     print("\n" + "="*60)
@@ -267,6 +267,7 @@ print("\n💡 最佳实践:")
 print("   - 进程间不能直接共享普通变量")
 print("   - 使用 multiprocessing.Manager")
 print("   - 使用 multiprocessing.Value 或 Array")
+print("   - 大块数值数组用 shared_memory 上的 NumPy 数组（见 01_process_basic.py 的 SharedArray）")
 print("   - 或者通过 Queue/Pipe 传递数据")
 
 